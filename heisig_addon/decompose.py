@@ -1,10 +1,14 @@
-"""Character decomposition lookup from bundled heisig_data.json."""
+"""Character decomposition lookup from bundled heisig_data.columns.json."""
 
 import json
 import os
 
 _DATA = None
-_DATA_PATH = os.path.join(os.path.dirname(__file__), "data", "heisig_data.json")
+_DATA_PATH = os.path.join(os.path.dirname(__file__), "data", "heisig_data.columns.json")
+# Older builds shipped one object per character
+_LEGACY_DATA_PATH = os.path.join(os.path.dirname(__file__), "data", "heisig_data.json")
+_VARIANTS = None
+_VARIANTS_PATH = os.path.join(os.path.dirname(__file__), "data", "variants.json")
 
 # IDS operator descriptions
 IDS_DESCRIPTIONS = {
@@ -23,18 +27,99 @@ IDS_DESCRIPTIONS = {
 }
 
 
+class _ColumnarData:
+    """Read-only char -> entry mapping over the columnar data file.
+
+    The file holds one array per field and a shared string table (see
+    scripts/build_addon_data.py); entries are rebuilt only when looked up.
+    """
+
+    def __init__(self, obj):
+        self._strings = obj["strings"]
+        self._columns = obj["columns"]
+        self._rows = {char: row for row, char in enumerate(obj["chars"])}
+
+    def _entry(self, row):
+        strings = self._strings
+        entry = {}
+        for column in self._columns:
+            kind, value = column["type"], column["values"][row]
+            if kind == "ref":
+                value = strings[value]
+            elif kind == "refs":
+                value = column["sep"].join(strings[i] for i in value)
+            elif kind == "int":
+                value = str(value) if value else ""
+            entry[column["name"]] = value
+        return entry
+
+    def get(self, char, default=None):
+        row = self._rows.get(char)
+        return default if row is None else self._entry(row)
+
+    def __contains__(self, char):
+        return char in self._rows
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    def __len__(self):
+        return len(self._rows)
+
+
 def _load():
     global _DATA
     if _DATA is None:
-        with open(_DATA_PATH, encoding="utf-8") as f:
-            _DATA = json.load(f)
+        if os.path.exists(_DATA_PATH):
+            with open(_DATA_PATH, encoding="utf-8") as f:
+                _DATA = _ColumnarData(json.load(f))
+        else:
+            with open(_LEGACY_DATA_PATH, encoding="utf-8") as f:
+                _DATA = json.load(f)
     return _DATA
 
 
+def entry_count() -> int:
+    """Number of characters in the bundled data."""
+    return len(_load())
+
+
+def characters() -> list:
+    """Every character (and 囧 primitive string) in the bundled data."""
+    return list(_load())
+
+
+def _load_variants():
+    global _VARIANTS
+    if _VARIANTS is None:
+        try:
+            with open(_VARIANTS_PATH, encoding="utf-8") as f:
+                _VARIANTS = json.load(f)
+        except FileNotFoundError:
+            _VARIANTS = {}
+    return _VARIANTS
+
+
+def canonical(char: str) -> str:
+    """Return the canonical form of a variant character (or the char itself).
+
+    Radical forms and traditional/kanji variants without their own entry
+    resolve to the named member of their variant class.
+    """
+    return _load_variants().get(char, char)
+
+
 def lookup(char: str) -> dict | None:
-    """Return decomposition dict for a character, or None if not found."""
+    """Return decomposition dict for a character, or None if not found.
+
+    Falls back to the character's canonical variant form.
+    """
     data = _load()
-    return data.get(char.strip())
+    char = char.strip()
+    info = data.get(char)
+    if info is None:
+        info = data.get(canonical(char))
+    return info
 
 
 def resolve_keyword(char: str, col, char_field: str, keyword_field: str) -> str:
@@ -42,7 +127,7 @@ def resolve_keyword(char: str, col, char_field: str, keyword_field: str) -> str:
 
     Checks the user's collection first (searching for a note whose
     char_field matches the character and whose keyword_field is non-empty).
-    Falls back to heisig_data.json, then to the character itself.
+    Falls back to the bundled data, then to the character itself.
     """
     if col is not None:
         try:
@@ -0,0 +1,150 @@
+"""Direct bulk SQLite writer for .apkg collections.
+
+Produces the same collection schema genanki does (its schema, col row,
+deck and model JSON are reused), but inserts notes and cards with one
+executemany() each inside a single transaction instead of building a
+genanki.Note per card. GUIDs, field joins, tag strings and the Anki
+first-field checksum are computed up front.
+
+Both writers finish with write_zip(), which streams the collection and
+media into the .apkg with fixed entry dates.
+
+  python scripts/build_apkg.py --writer sqlite          # use this writer
+  python scripts/build_apkg.py --compare-writers        # parity + timing
+"""
+
+import hashlib
+import html
+import itertools
+import json
+import os
+import re
+import shutil
+import sqlite3
+import zipfile
+
+from genanki.apkg_col import APKG_COL
+from genanki.apkg_schema import APKG_SCHEMA
+from genanki.util import guid_for
+
+from artifacts import AtomicOutput
+
+# Fixed zip entry date so identical decks produce identical .apkg bytes
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+_IMG_SRC = re.compile(r"""<img[^>]+src=["']?([^"'>]+)["']?[^>]*>""", re.I)
+_TAG = re.compile(r"<.*?>", re.S)
+
+
+def anki_checksum(field):
+    """Anki's duplicate-check checksum of a note's first field.
+
+    First 8 hex digits of the SHA-1 of the field with HTML stripped and
+    image tags replaced by their file names.
+    """
+    text = html.unescape(_TAG.sub("", _IMG_SRC.sub(r" \1 ", field)))
+    return int(hashlib.sha1(text.encode("utf-8")).hexdigest()[:8], 16)
+
+
+def prepare_note(fields, tags, sort_field=None, guid=None):
+    """Precompute one note's row values: (guid, flds, sfld, tags, csum)."""
+    return (
+        guid or guid_for(*fields),
+        "\x1f".join(fields),
+        sort_field,
+        " " + " ".join(tags) + " ",
+        anki_checksum(fields[0]),
+    )
+
+
+def write_collection(db_path, model, deck, notes, timestamp):
+    """Write a collection with one deck and one model to db_path.
+
+    notes: (fields, prepared) pairs, where prepared comes from
+    prepare_note(). IDs follow genanki: one counter from
+    timestamp * 1000, a note's ID followed by its cards' IDs.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        # Scratch file: durability only matters once it is zipped
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.executescript(APKG_SCHEMA)
+        conn.executescript(APKG_COL)
+
+        (decks_json,) = conn.execute("SELECT decks FROM col").fetchone()
+        decks = json.loads(decks_json)
+        decks[str(deck.deck_id)] = deck.to_json()
+        (models_json,) = conn.execute("SELECT models FROM col").fetchone()
+        models = json.loads(models_json)
+        models[str(model.model_id)] = model.to_json(timestamp, deck.deck_id)
+        conn.execute("UPDATE col SET decks = ?, models = ?", (json.dumps(decks), json.dumps(models)))
+
+        # Which card templates a note generates depends only on which
+        # fields are non-empty
+        reqs = [(ord_, any if how == "any" else all, field_ords)
+                for ord_, how, field_ords in model._req]
+        mod = int(timestamp)
+        ids = itertools.count(int(timestamp * 1000))
+        note_rows, card_rows = [], []
+        for fields, (guid, flds, sfld, tags, csum) in notes:
+            nid = next(ids)
+            if sfld is None:
+                sfld = fields[model.sort_field_index]
+            note_rows.append((nid, guid, model.model_id, mod, -1, tags, flds, sfld, csum, 0, ""))
+            for ord_, op, field_ords in reqs:
+                if op(fields[i] for i in field_ords):
+                    card_rows.append((next(ids), nid, deck.deck_id, ord_, mod, -1,
+                                      0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, ""))
+
+        with conn:
+            conn.executemany("INSERT INTO notes VALUES(?,?,?,?,?,?,?,?,?,?,?)", note_rows)
+            conn.executemany("INSERT INTO cards VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)", card_rows)
+    finally:
+        conn.close()
+    return len(note_rows)
+
+
+def _zip_entry(name):
+    info = zipfile.ZipInfo(name, date_time=ZIP_DATE_TIME)
+    info.external_attr = 0o644 << 16
+    return info
+
+
+def write_zip(db_path, media_files, output_path):
+    """Stream a collection and its media into output_path (replaced only if changed).
+
+    Returns True if the file was rewritten.
+    """
+    out = AtomicOutput(output_path, path_only=True)
+    with out as tmp_path:
+        with zipfile.ZipFile(tmp_path, "w") as outzip:
+            _copy_into(outzip, "collection.anki2", db_path)
+            media_json = {idx: os.path.basename(path) for idx, path in enumerate(media_files)}
+            outzip.writestr(_zip_entry("media"), json.dumps(media_json))
+            for idx, path in enumerate(media_files):
+                _copy_into(outzip, str(idx), path)
+    return out.changed
+
+
+def _copy_into(outzip, name, path):
+    with open(path, "rb") as src, outzip.open(_zip_entry(name), "w") as dst:
+        shutil.copyfileobj(src, dst, 1 << 20)
+
+
+def collection_rows(db_path):
+    """Everything in a collection that parity checks compare.
+
+    Returns {"col": (decks, models) as parsed JSON, "notes": rows,
+    "cards": rows}. Note rows leave out csum, which genanki does not
+    fill in (it writes 0) and Anki recomputes on import.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        decks, models = conn.execute("SELECT decks, models FROM col").fetchone()
+        notes = conn.execute(
+            "SELECT id, guid, mid, mod, usn, tags, flds, sfld, flags, data FROM notes ORDER BY id").fetchall()
+        cards = conn.execute("SELECT * FROM cards ORDER BY id").fetchall()
+    finally:
+        conn.close()
+    return {"col": (json.loads(decks), json.loads(models)), "notes": notes, "cards": cards}
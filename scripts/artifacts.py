@@ -0,0 +1,132 @@
+"""Write generated artifacts only when their content actually changes.
+
+Every build output (deck CSVs, add-on data, .apkg packages, primitive
+PNGs, intermediate JSON) goes through these helpers. Content is rendered to
+memory or to a temp file next to the target, its SHA-256 is compared with
+the existing file, and the target is replaced atomically (os.replace) only
+if it differs. Unchanged outputs keep their mtime and produce no git diff.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+
+def _sha256_file(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.digest()
+
+
+def file_sha256(path):
+    """Hex SHA-256 of a file's contents."""
+    return _sha256_file(path).hex()
+
+
+def _default_mode():
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+def _same_content(tmp_path, path):
+    if not path.exists():
+        return False
+    if os.path.getsize(tmp_path) != os.path.getsize(path):
+        return False
+    return _sha256_file(tmp_path) == _sha256_file(path)
+
+
+def _temp_path(path):
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    os.close(fd)
+    return Path(tmp)
+
+
+def replace_if_changed(tmp_path, path):
+    """Move tmp_path over path unless both have the same content.
+
+    tmp_path must be on the same filesystem as path. It is always consumed.
+    Returns True if path was (re)written.
+    """
+    tmp_path, path = Path(tmp_path), Path(path)
+    if _same_content(tmp_path, path):
+        tmp_path.unlink()
+        return False
+    if path.exists():
+        shutil.copymode(path, tmp_path)
+    else:
+        os.chmod(tmp_path, _default_mode())
+    os.replace(tmp_path, path)
+    return True
+
+
+def write_bytes_if_changed(path, data):
+    """Atomically write bytes to path if they differ. Returns True if written."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.exists() and os.path.getsize(path) == len(data):
+        if _sha256_file(path) == hashlib.sha256(data).digest():
+            return False
+    tmp = _temp_path(path)
+    try:
+        with open(tmp, "wb") as f:
+            f.write(data)
+    except BaseException:
+        tmp.unlink()
+        raise
+    return replace_if_changed(tmp, path)
+
+
+def write_text_if_changed(path, text, encoding="utf-8"):
+    """Atomically write text to path if it differs. Returns True if written."""
+    return write_bytes_if_changed(path, text.encode(encoding))
+
+
+class AtomicOutput:
+    """Context manager that streams into a temp file and replaces path on exit.
+
+        out = AtomicOutput("RTH_deck.csv", "w", encoding="utf-8", newline="")
+        with out as f:
+            csv.writer(f).writerows(rows)
+        out.changed  # True if RTH_deck.csv was rewritten
+
+    Use path_only=True to get the temp path instead of an open file, for
+    libraries that insist on writing to a filename themselves.
+    """
+
+    def __init__(self, path, mode="w", path_only=False, **open_kwargs):
+        self.path = Path(path)
+        self.mode = mode
+        self.path_only = path_only
+        self.open_kwargs = open_kwargs
+        self.changed = False
+        self._tmp = None
+        self._file = None
+
+    def __enter__(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._tmp = _temp_path(self.path)
+        if self.path_only:
+            return self._tmp
+        self._file = open(self._tmp, self.mode, **self.open_kwargs)
+        return self._file
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._file is not None:
+            self._file.close()
+        if exc_type is not None:
+            if self._tmp.exists():
+                self._tmp.unlink()
+            return False
+        self.changed = replace_if_changed(self._tmp, self.path)
+        return False
+
+
+def status(changed):
+    """Short label for summaries: 'written' or 'unchanged'."""
+    return "written" if changed else "unchanged"
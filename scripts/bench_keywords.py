@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""Benchmark keyword assignment in generate_keywords.py.
+
+Times KeywordAssigner against the original per-character loop
+(reference_assign) on seeded, collision-heavy synthetic dictionaries, so
+no CEDICT or Unihan files are needed, and checks that both assign the
+same keywords. Exits non-zero if they differ.
+
+Usage:
+  python scripts/bench_keywords.py
+  python scripts/bench_keywords.py --chars 50000 --repeat 5
+"""
+
+import argparse
+import random
+import sys
+import time
+
+from generate_keywords import KeywordAssigner, normalize_keyword
+
+
+def synthetic_dictionaries(n, seed=0):
+    """Collision-heavy (chars, cedict, unihan, used) for benchmarking.
+
+    Definitions are drawn from a small vocabulary with Zipf-like weights,
+    with plural forms mixed in, so most characters collide and fall
+    through to numbered suffixes, and the most common bases run out of
+    them. Some characters are only in Unihan and some in neither.
+    """
+    rng = random.Random(seed)
+    vocab = [f"word{i}" for i in range(n // 3)]
+    vocab += [w + "s" for w in vocab[: len(vocab) // 4]]
+    weights = [1 / (rank + 1) for rank in range(len(vocab))]
+    chars = [chr(0x4E00 + i) for i in range(n)]
+    cedict, unihan = {}, {}
+    for char in chars:
+        roll = rng.random()
+        if roll < 0.8:
+            cedict[char] = {"pinyin": "zi4", "defs": rng.choices(vocab, weights, k=rng.randint(1, 4))}
+        if 0.6 < roll < 0.97:
+            unihan[char] = rng.choices(vocab, weights, k=rng.randint(1, 3))
+    used = {normalize_keyword(w) for w in rng.sample(vocab, len(vocab) // 10)}
+    return chars, cedict, unihan, used
+
+
+def reference_assign(chars, cedict, unihan, used_keywords):
+    """The original assignment loop, kept for benchmarking and parity checks.
+
+    Returns {char: (keyword, reading, source) or None}.
+    """
+    used = set(used_keywords)
+    result = {}
+    for char in chars:
+        keyword, reading, source = None, "", None
+        if char in cedict:
+            reading = cedict[char]["pinyin"]
+            for d in cedict[char]["defs"]:
+                norm = normalize_keyword(d)
+                if norm not in used:
+                    keyword, source = d, "cedict"
+                    used.add(norm)
+                    break
+        if keyword is None and char in unihan:
+            for d in unihan[char]:
+                norm = normalize_keyword(d)
+                if norm not in used:
+                    keyword, source = d, "unihan"
+                    used.add(norm)
+                    break
+        if keyword is None:
+            base_def = None
+            if char in cedict and cedict[char]["defs"]:
+                base_def = cedict[char]["defs"][0]
+            elif char in unihan and unihan[char]:
+                base_def = unihan[char][0]
+            if base_def:
+                for i in range(2, 100):
+                    candidate = f"{base_def} ({i})"
+                    norm = normalize_keyword(candidate)
+                    if norm not in used:
+                        keyword = candidate
+                        source = "cedict+num" if char in cedict else "unihan+num"
+                        used.add(norm)
+                        break
+        result[char] = (keyword, reading, source) if keyword else None
+    return result
+
+
+def benchmark_assignment(n, repeat=3, seed=0):
+    """Time KeywordAssigner against reference_assign(); True if outputs match."""
+    chars, cedict, unihan, used = synthetic_dictionaries(n, seed)
+
+    def engine():
+        assigner = KeywordAssigner(cedict, unihan, used)
+        return {char: assigner.assign(char) for char in chars}
+
+    def reference():
+        return reference_assign(chars, cedict, unihan, used)
+
+    outputs, best = {}, {}
+    for label, func in [("KeywordAssigner", engine), ("reference loop", reference)]:
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            outputs[label] = func()
+            times.append(time.perf_counter() - start)
+        best[label] = min(times)
+
+    assigned = outputs["KeywordAssigner"]
+    numbered = sum(1 for a in assigned.values() if a and a[2].endswith("+num"))
+    failed = sum(1 for a in assigned.values() if a is None)
+    print(f"{n} synthetic characters (seed {seed}): {numbered} numbered, {failed} without a keyword")
+    for label, seconds in best.items():
+        print(f"  {label:<16} {seconds:.3f}s  {n / seconds:,.0f} chars/s")
+    print(f"  speedup {best['reference loop'] / best['KeywordAssigner']:.1f}x")
+    same = assigned == outputs["reference loop"]
+    print(f"  identical output: {'yes' if same else 'NO'}")
+    return same
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chars", type=int, default=11000,
+                        help="synthetic characters to assign (default 11000)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per implementation (best is kept)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    sys.exit(0 if benchmark_assignment(args.chars, max(1, args.repeat), args.seed) else 1)
+
+
+if __name__ == "__main__":
+    main()
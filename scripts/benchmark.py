@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""Benchmark each pipeline stage on the bundled data.
+
+Runs every stage from build.py whose inputs are present, in dependency
+order, in a temporary copy of the repository (so the committed decks,
+.apkg files and other outputs are left alone), and records per stage:
+
+  wall_s       wall-clock seconds
+  cpu_s        user + system CPU seconds of the stage process
+  peak_rss_mb  peak resident memory of the stage process (ru_maxrss)
+
+Results go to data/cache/benchmark_results.json. With --check, each stage
+is compared against the stored baseline and the script exits non-zero if
+wall time, CPU time or peak memory grew by more than --threshold. Record
+a baseline with --save-baseline.
+
+Timings only compare on the same machine, so baselines are per-machine
+and not committed: they live in data/cache/benchmark_baseline.json with
+the platform they were recorded on. --check without a baseline (e.g. on a
+fresh checkout) warns and compares nothing; a baseline from another
+machine is used, with a warning.
+
+Usage:
+  python scripts/benchmark.py                    # measure and print
+  python scripts/benchmark.py --save-baseline    # measure and store baseline
+  python scripts/benchmark.py --check --threshold 0.2
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from artifacts import write_text_if_changed
+from build import ROOT, STAGES, expand
+
+RESULTS_PATH = ROOT / "data" / "cache" / "benchmark_results.json"
+BASELINE_PATH = ROOT / "data" / "cache" / "benchmark_baseline.json"
+METRICS = ["wall_s", "cpu_s", "peak_rss_mb"]
+
+# ru_maxrss is kilobytes on Linux, bytes on macOS
+_RSS_TO_MB = 1 / (1024 * 1024) if sys.platform == "darwin" else 1 / 1024
+
+
+def copy_tree(dest):
+    """Copy the working tree (without .git) to dest for the stages to run in."""
+    shutil.copytree(ROOT, dest, ignore=shutil.ignore_patterns(".git", "__pycache__"))
+
+
+def machine():
+    """What a baseline was recorded on."""
+    return {"node": platform.node(), "arch": platform.machine(), "cpus": os.cpu_count()}
+
+
+def measure(args, cwd):
+    """Run one stage script in cwd and return its metrics (None if it failed)."""
+    with tempfile.TemporaryFile() as err:
+        start = time.perf_counter()
+        proc = subprocess.Popen([sys.executable] + args, cwd=cwd,
+                                stdout=subprocess.DEVNULL, stderr=err)
+        _, wait_status, usage = os.wait4(proc.pid, 0)
+        wall = time.perf_counter() - start
+        proc.returncode = os.waitstatus_to_exitcode(wait_status)
+        if proc.returncode != 0:
+            err.seek(0)
+            print(err.read().decode("utf-8", "replace").rstrip())
+            return None
+    return {
+        "wall_s": round(wall, 3),
+        "cpu_s": round(usage.ru_utime + usage.ru_stime, 3),
+        "peak_rss_mb": round(usage.ru_maxrss * _RSS_TO_MB, 1),
+    }
+
+
+def run(stage_names, repeat, cwd):
+    """Measure the selected stages; each metric is the best of `repeat` runs."""
+    results = {}
+    for name, args, inputs, _, optional in STAGES:
+        if stage_names and name not in stage_names:
+            continue
+        if optional and name not in stage_names:
+            continue
+        _, missing = expand(inputs)
+        if missing:
+            print(f"  {name}: skipped, missing {', '.join(missing)}")
+            continue
+
+        runs = [measure(args, cwd) for _ in range(repeat)]
+        if any(r is None for r in runs):
+            print(f"  {name}: FAILED")
+            results[name] = None
+            continue
+        results[name] = {m: min(r[m] for r in runs) for m in METRICS}
+        r = results[name]
+        print(f"  {name:<20} {r['wall_s']:>8.2f}s wall {r['cpu_s']:>8.2f}s cpu "
+              f"{r['peak_rss_mb']:>8.1f} MB")
+    return results
+
+
+def compare(results, baseline, threshold, min_seconds):
+    """Return a list of regression messages (empty if none)."""
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if current is None or base is None:
+            continue
+        for metric in METRICS:
+            old, new = base[metric], current[metric]
+            if metric != "peak_rss_mb" and old < min_seconds and new < min_seconds:
+                continue  # too short to compare reliably
+            if old and new > old * (1 + threshold):
+                regressions.append(f"{name}.{metric}: {old} -> {new} "
+                                   f"(+{(new / old - 1) * 100:.0f}%)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("stages", nargs="*", help="stages to benchmark (default: all non-optional)")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per stage (best is kept)")
+    parser.add_argument("--check", action="store_true", help="fail on regression against the baseline")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="allowed relative growth per metric (default 0.25 = 25%%)")
+    parser.add_argument("--min-seconds", type=float, default=0.5,
+                        help="ignore time metrics below this many seconds (default 0.5)")
+    parser.add_argument("--save-baseline", action="store_true", help="store results as the new baseline")
+    args = parser.parse_args()
+
+    print("Benchmarking pipeline stages...")
+    with tempfile.TemporaryDirectory(prefix="heisig-benchmark-") as tmp:
+        tree = os.path.join(tmp, "tree")
+        copy_tree(tree)
+        results = run(args.stages, max(1, args.repeat), tree)
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": machine(),
+        "stages": results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    write_text_if_changed(RESULTS_PATH, text)
+    print(f"\nResults: {RESULTS_PATH}")
+
+    if args.save_baseline:
+        write_text_if_changed(BASELINE_PATH, text)
+        print(f"Baseline saved: {BASELINE_PATH}")
+
+    failed = any(r is None for r in results.values())
+    if args.check and not BASELINE_PATH.exists():
+        print(f"\nWarning: no baseline at {BASELINE_PATH}, nothing to compare; "
+              f"record one on this machine with --save-baseline")
+    elif args.check:
+        with open(BASELINE_PATH, "r", encoding="utf-8") as f:
+            stored = json.load(f)
+        if stored.get("machine") != report["machine"]:
+            print(f"\nWarning: baseline was recorded on {stored.get('machine')}, "
+                  f"this is {report['machine']}; timings may not compare")
+        regressions = compare(results, stored["stages"], args.threshold, args.min_seconds)
+        if regressions:
+            print(f"\nRegressions beyond {args.threshold:.0%}:")
+            for msg in regressions:
+                print(f"  {msg}")
+            failed = True
+        else:
+            print(f"\nNo regressions beyond {args.threshold:.0%}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""Run the build pipeline in dependency order, skipping up-to-date stages.
+
+Each stage declares the files it reads and writes. A stage depends on every
+earlier stage that writes one of its inputs; independent stages (e.g.
+crop_primitives and build_mapping) run in parallel. A stage is skipped when
+its outputs exist and the SHA-256 of its inputs (including its own script)
+matches what was recorded after its last successful run, in
+data/cache/build_state.json.
+
+Stages whose inputs are missing (e.g. the Excel workbook, which isn't in
+the repo) are skipped and downstream stages use the committed outputs.
+
+Usage:
+  python scripts/build.py                 # everything except optional stages
+  python scripts/build.py build_apkg      # one stage plus whatever it needs
+  python scripts/build.py --force         # ignore recorded state
+  python scripts/build.py --list          # show stages and dependencies
+"""
+
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+from artifacts import file_sha256, write_text_if_changed
+
+ROOT = Path(__file__).resolve().parent.parent
+STATE_PATH = ROOT / "data" / "cache" / "build_state.json"
+
+EXCEL = "data/Heisig's Remembering the Kanji vs. Hanzi v27.xlsx"
+RSH_XML = "data/heisig-repo/rsh.xml"
+DECK_CSVS = ["RTH_deck.csv", "RSH_deck.csv", "RTK_deck.csv", "Ultimate_deck.csv"]
+
+# (name, script args, inputs, outputs, optional)
+# Inputs may be glob patterns. Order matters: a stage depends on the
+# earlier stages that produce its inputs.
+STAGES = [
+    ("parse_rsh", ["scripts/parse_rsh.py"],
+     [RSH_XML, "scripts/artifacts.py", "scripts/rsh_xml.py"],
+     ["data/rsh_parsed.json"], False),
+    ("crop_primitives", ["scripts/crop_primitives.py"],
+     [RSH_XML, "data/primitive_images/manual/*.png", "scripts/artifacts.py", "scripts/rsh_xml.py",
+      "scripts/sprites.py"],
+     ["data/primitive_images/manifest.json", "data/primitive_images/atlas.json"], False),
+    ("build_mapping", ["scripts/build_mapping.py"],
+     ["data/rsh_parsed.json", EXCEL, "data/IDS.TXT", "scripts/artifacts.py", "scripts/variants.py"],
+     ["data/unified_mapping.json", "data/unmapped_components.json", "data/variant_map.json"], False),
+    ("build_decks", ["scripts/build_decks.py"],
+     ["data/rsh_parsed.json", EXCEL, "data/IDS.TXT", "data/unified_mapping.json",
+      "data/variant_map.json", "data/unmapped_human_reviewed.csv",
+      "scripts/artifacts.py", "scripts/cedict_index.py", "scripts/variants.py"],
+     DECK_CSVS, False),
+    # Reads heisig_addon/data/heisig_data.columns.json only to learn the Heisig
+    # keywords, which merge_generated never changes; it is not declared as
+    # an input to keep the graph acyclic. Needs cedict.txt and Unihan,
+    # which aren't in the repo, so it only runs when named explicitly.
+    # Extends the keyword assignment store in place.
+    ("generate_keywords", ["scripts/generate_keywords.py", "--regenerate"],
+     ["data/cedict.txt", "data/Unihan_Readings.txt", "data/IDS.TXT",
+      "data/additional_characters/mainland_characters.csv",
+      "data/additional_characters/taiwan_char list.xlsx",
+      "data/keyword_assignments.json", "data/keyword_overrides.json",
+      "scripts/artifacts.py", "scripts/build_addon_data.py", "scripts/cedict_index.py",
+      "scripts/unihan_index.py"],
+     ["data/generated_simplified.json", "data/generated_traditional.json",
+      "data/keyword_assignments.json"], True),
+    # Rewrites the deck CSVs in place
+    ("merge_generated", ["scripts/merge_generated.py"],
+     ["data/generated_simplified.json", "data/generated_traditional.json",
+      "RSH_deck.csv", "RTH_deck.csv", "Ultimate_deck.csv", "scripts/artifacts.py"],
+     ["data/simplified_additions.csv", "RSH_deck.csv", "RTH_deck.csv", "Ultimate_deck.csv"], False),
+    ("build_addon_data", ["scripts/build_addon_data.py"],
+     ["Ultimate_deck.csv", "data/variant_map.json", "data/rsh_parsed.json",
+      "data/primitive_images/atlas.json", "data/primitive_images/_heisig_primitives.png",
+      "scripts/artifacts.py", "scripts/variants.py", "scripts/sprites.py", "scripts/optimize_media.py"],
+     ["heisig_addon/data/heisig_data.columns.json", "heisig_addon/data/variants.json",
+      "docs/primitives.png", "docs/primitives.json", "docs/data/index.json"], False),
+    ("build_apkg", ["scripts/build_apkg.py"],
+     DECK_CSVS + ["data/rsh_parsed.json", "data/primitive_images/manifest.json",
+                  "data/primitive_images/atlas.json", "data/primitive_images/*.png",
+                  "scripts/artifacts.py", "scripts/apkg_writer.py", "scripts/optimize_media.py",
+                  "scripts/sprites.py"],
+     ["RTH_deck.apkg", "RSH_deck.apkg", "RTK_deck.apkg", "Ultimate_deck.apkg"], False),
+]
+
+
+def expand(patterns):
+    """Resolve input patterns to existing files, plus a list of missing ones."""
+    files, missing = [], []
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            files.extend(sorted(os.path.relpath(p, ROOT)
+                                for p in glob.glob(str(ROOT / pattern))))
+        elif (ROOT / pattern).exists():
+            files.append(pattern)
+        else:
+            missing.append(pattern)
+    return files, missing
+
+
+def stage_dependencies():
+    """Map stage name -> set of earlier stage names that write its inputs."""
+    deps = {}
+    for i, (name, _, inputs, _, _) in enumerate(STAGES):
+        deps[name] = set()
+        for other, _, _, outputs, _ in STAGES[:i]:
+            if set(inputs) & set(outputs):
+                deps[name].add(other)
+    return deps
+
+
+def input_hashes(args, inputs):
+    files, missing = expand(inputs + [args[0]])
+    return {path: file_sha256(ROOT / path) for path in files}, missing
+
+
+def load_state():
+    if STATE_PATH.exists():
+        with open(STATE_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {}
+
+
+def run_stage(args):
+    """Run one stage script from the repo root; return (returncode, output, wall seconds)."""
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable] + args, cwd=ROOT,
+                          stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    return proc.returncode, proc.stdout, time.perf_counter() - start
+
+
+def select(targets, deps):
+    """Stages to consider: the targets plus everything they depend on."""
+    optional = {name for name, *_, opt in STAGES if opt}
+    wanted = set(targets) if targets else {name for name, *_ in STAGES} - optional
+    stack = list(wanted)
+    while stack:
+        for dep in deps[stack.pop()]:
+            if dep not in wanted and (dep not in optional or dep in targets):
+                wanted.add(dep)
+                stack.append(dep)
+    return [name for name, *_ in STAGES if name in wanted]
+
+
+def build(targets, force=False, jobs=None, verbose=False):
+    deps = stage_dependencies()
+    order = select(targets, deps)
+    stages = {name: (args, inputs, outputs) for name, args, inputs, outputs, _ in STAGES}
+    state = load_state()
+    results = {}  # name -> (status, seconds)
+
+    pending = list(order)
+    running = {}
+    with ThreadPoolExecutor(max_workers=jobs or os.cpu_count()) as pool:
+        while pending or running:
+            for name in list(pending):
+                waiting = [d for d in deps[name] if d in order and d not in results]
+                if waiting:
+                    continue
+                pending.remove(name)
+                args, inputs, outputs = stages[name]
+
+                if any(results[d][0] in ("FAILED", "blocked") for d in deps[name] if d in results):
+                    results[name] = ("blocked", 0.0)
+                    continue
+
+                hashes, missing = input_hashes(args, inputs)
+                outputs_exist = all((ROOT / o).exists() for o in outputs)
+                if missing:
+                    results[name] = ("missing input", 0.0)
+                    print(f"  {name}: skipped, missing {', '.join(missing)}")
+                    continue
+                if not force and outputs_exist and state.get(name) == hashes:
+                    results[name] = ("up to date", 0.0)
+                    continue
+
+                print(f"  {name}: running")
+                running[pool.submit(run_stage, args)] = name
+
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                args, inputs, _ = stages[name]
+                code, output, seconds = future.result()
+                if verbose or code != 0:
+                    print(f"\n── {name} ──\n{output.rstrip()}\n")
+                if code == 0:
+                    # Hash after the run: merge_generated rewrites its own inputs
+                    state[name] = input_hashes(args, inputs)[0]
+                    results[name] = ("ran", seconds)
+                else:
+                    state.pop(name, None)
+                    results[name] = ("FAILED", seconds)
+
+    write_text_if_changed(STATE_PATH, json.dumps(state, ensure_ascii=False, indent=2))
+
+    print(f"\n{'stage':<20} {'status':<15} {'seconds':>8}")
+    print("-" * 45)
+    for name in order:
+        status, seconds = results[name]
+        print(f"{name:<20} {status:<15} {seconds:>8.2f}")
+    return all(status != "FAILED" for status, _ in results.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("stages", nargs="*", help="stages to build (default: all non-optional)")
+    parser.add_argument("--force", action="store_true", help="rerun stages even if up to date")
+    parser.add_argument("-j", "--jobs", type=int, help="max stages to run in parallel")
+    parser.add_argument("-v", "--verbose", action="store_true", help="print each stage's output")
+    parser.add_argument("--list", action="store_true", help="list stages and exit")
+    args = parser.parse_args()
+
+    deps = stage_dependencies()
+    if args.list:
+        for name, _, _, _, optional in STAGES:
+            after = ", ".join(sorted(deps[name])) or "-"
+            print(f"{name:<20} after: {after}{'  (optional)' if optional else ''}")
+        return
+
+    unknown = [s for s in args.stages if s not in deps]
+    if unknown:
+        parser.error(f"unknown stage(s): {', '.join(unknown)}")
+
+    ok = build(args.stages, force=args.force, jobs=args.jobs, verbose=args.verbose)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
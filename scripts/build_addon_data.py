@@ -1,15 +1,258 @@
 #!/usr/bin/env python3
-"""Build heisig_data.json from Ultimate_deck.csv for the Anki add-on and web demo."""
+"""Build the character data for the Anki add-on and web demo from Ultimate_deck.csv.
+
+The data is written in a columnar, string-interned layout
+(heisig_data.columns.json; see encode_columnar), read by
+heisig_addon/decompose.py and docs/index.html.
+
+The web demo also gets the primitive sprite atlas (primitives.png) and
+primitives.json, which maps each 囧 string to its keyword and the CSS
+background offset of its sprite.
+
+For the demo the data is also split into shards under docs/data/, one per
+SHARD_SPAN codepoints of each CJK Unicode block. Shards use the same
+columnar layout, minified and precompressed (.gz, and .br if the brotli
+module is installed) and named by content hash, so they can be cached
+forever; docs/data/index.json maps codepoint ranges to shard files and is
+the only file that must be revalidated.
+"""
 
 import csv
+import gzip
+import hashlib
 import json
 import os
+from collections import Counter
+from pathlib import Path
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from artifacts import status, write_bytes_if_changed, write_text_if_changed
+from optimize_media import optimize_media
+from sprites import (ATLAS_PATH, background_position, background_size,
+                     jiong_primitives, load_atlas)
+from variants import load_variant_map
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 PROJECT_DIR = os.path.dirname(SCRIPT_DIR)
 CSV_PATH = os.path.join(PROJECT_DIR, "Ultimate_deck.csv")
-ADDON_OUT = os.path.join(PROJECT_DIR, "heisig_addon", "data", "heisig_data.json")
-DOCS_OUT = os.path.join(PROJECT_DIR, "docs", "heisig_data.json")
+ADDON_DATA_DIR = os.path.join(PROJECT_DIR, "heisig_addon", "data")
+ADDON_OUT = os.path.join(ADDON_DATA_DIR, "heisig_data.columns.json")
+ADDON_VARIANTS_OUT = os.path.join(ADDON_DATA_DIR, "variants.json")
+DOCS_ATLAS_OUT = os.path.join(PROJECT_DIR, "docs", "primitives.png")
+DOCS_SPRITES_OUT = os.path.join(PROJECT_DIR, "docs", "primitives.json")
+DOCS_SHARDS_DIR = os.path.join(PROJECT_DIR, "docs", "data")
+
+# (name, first codepoint, last codepoint); anything else goes to "other"
+UNICODE_BLOCKS = [
+    ("radicals", 0x2E80, 0x2FDF),      # CJK Radicals Supplement, Kangxi Radicals
+    ("ext-a", 0x3400, 0x4DBF),
+    ("uro", 0x4E00, 0x9FFF),           # CJK Unified Ideographs
+    ("compat", 0xF900, 0xFAFF),
+    ("ext-b", 0x20000, 0x2A6DF),
+    ("ext-c-f", 0x2A700, 0x2EBEF),
+    ("compat-sup", 0x2F800, 0x2FA1F),
+    ("ext-g-h", 0x30000, 0x323AF),
+]
+# Large blocks are split into shards of this many codepoints
+SHARD_SPAN = 0x200
+SHARD_HASH_LEN = 10
+
+
+# Columnar layout: how each field is stored
+#   ref   index into the shared string table
+#   refs  list of indexes, joined with the separator when decoding
+#   int   integer, 0 if empty (book numbers)
+#   text  the string itself (values that rarely repeat)
+COLUMNS = [
+    ("keyword", "ref", None),
+    ("reading", "text", None),
+    ("decomposition", "refs", " + "),
+    ("spatial", "ref", None),
+    ("ids", "text", None),
+    ("components_detail", "refs", "<br>"),
+    ("RTH_number", "int", None),
+    ("RSH_number", "int", None),
+    ("RTK_number", "int", None),
+    ("tags", "ref", None),
+]
+COLUMNAR_VERSION = 1
+
+
+def encode_columnar(data):
+    """Encode {char: entry} as one array per field plus a string table.
+
+    Keywords, component lines (HTML markup included), spatial labels and
+    tag sets repeat thousands of times; each distinct string is stored
+    once and referenced by index, most frequent first so common
+    references are short. Index 0 is the empty string. Decoding is
+    exact: decompose.py and docs/index.html rebuild the same entries.
+    """
+    split = {}
+    counts = Counter()
+    for field, kind, sep in COLUMNS:
+        values = [entry.get(field, "") for entry in data.values()]
+        if kind == "ref":
+            counts.update(values)
+        elif kind == "refs":
+            values = [v.split(sep) if v else [] for v in values]
+            for parts in values:
+                counts.update(parts)
+        split[field] = values
+    counts.pop("", None)
+    by_frequency = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+    strings = [""] + [s for s, _ in by_frequency]
+    ref = {s: i for i, s in enumerate(strings)}
+
+    columns = []
+    for field, kind, sep in COLUMNS:
+        values = split[field]
+        if kind == "ref":
+            encoded = [ref[v] for v in values]
+        elif kind == "refs":
+            encoded = [[ref[part] for part in parts] for parts in values]
+        elif kind == "int":
+            encoded = [int(v) if v else 0 for v in values]
+            if any(str(n) != v for v, n in zip(values, encoded) if v):
+                raise ValueError(f"{field} has values that aren't plain integers")
+        else:
+            encoded = values
+        column = {"name": field, "type": kind, "values": encoded}
+        if sep:
+            column["sep"] = sep
+        columns.append(column)
+    return {
+        "version": COLUMNAR_VERSION,
+        "chars": list(data),
+        "strings": strings,
+        "columns": columns,
+    }
+
+
+def decode_columnar(obj):
+    """Inverse of encode_columnar: {char: entry}."""
+    strings = obj["strings"]
+    decoded = []
+    for column in obj["columns"]:
+        kind, values = column["type"], column["values"]
+        if kind == "ref":
+            values = [strings[i] for i in values]
+        elif kind == "refs":
+            sep = column["sep"]
+            values = [sep.join(strings[i] for i in refs) for refs in values]
+        elif kind == "int":
+            values = [str(n) if n else "" for n in values]
+        decoded.append((column["name"], values))
+    return {char: {name: values[row] for name, values in decoded}
+            for row, char in enumerate(obj["chars"])}
+
+
+def load_addon_data(path=ADDON_OUT):
+    """The add-on data as {char: entry}."""
+    with open(path, "r", encoding="utf-8") as f:
+        return decode_columnar(json.load(f))
+
+
+def dump_compact(obj):
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def shard_ranges():
+    """(name, first, last) for every shard a block can contribute."""
+    for name, first, last in UNICODE_BLOCKS:
+        for start in range(first, last + 1, SHARD_SPAN):
+            yield f"{name}-{start:x}", start, min(start + SHARD_SPAN - 1, last)
+
+
+def shard_of(char):
+    """Name of the shard holding char, keyed by its first codepoint."""
+    cp = ord(char[0])
+    for name, first, last in UNICODE_BLOCKS:
+        if first <= cp <= last:
+            start = first + (cp - first) // SHARD_SPAN * SHARD_SPAN
+            return f"{name}-{start:x}"
+    return "other"
+
+
+def write_precompressed(path, data):
+    """Write data plus .gz (and .br) siblings. Returns True if any changed."""
+    changed = write_bytes_if_changed(path, data)
+    changed |= write_bytes_if_changed(path + ".gz", gzip.compress(data, 9, mtime=0))
+    if brotli is not None:
+        changed |= write_bytes_if_changed(path + ".br",
+                                          brotli.compress(data, quality=11))
+    return changed
+
+
+def build_shards(data, out_dir=DOCS_SHARDS_DIR):
+    """Write content-hashed shards of data and their index; remove stale shards."""
+    by_shard = {}
+    for char, entry in data.items():
+        by_shard.setdefault(shard_of(char), {})[char] = entry
+
+    ranges = {name: (first, last) for name, first, last in shard_ranges()}
+    index = {"version": 1, "shards": [], "other": None}
+    # Precompressed siblings this build writes; anything else in out_dir is
+    # stale, including .br files from an earlier build that had brotli
+    suffixes = ("", ".gz", ".br") if brotli is not None else ("", ".gz")
+    files = {"index.json" + s for s in suffixes}
+    raw = gz = written = 0
+    for name in sorted(by_shard, key=lambda n: ranges.get(n, (float("inf"),))[0]):
+        blob = dump_compact(encode_columnar(by_shard[name]))
+        fname = f"{name}.{hashlib.sha256(blob).hexdigest()[:SHARD_HASH_LEN]}.json"
+        written += write_precompressed(os.path.join(out_dir, fname), blob)
+        files.update(fname + s for s in suffixes)
+        raw += len(blob)
+        gz += os.path.getsize(os.path.join(out_dir, fname + ".gz"))
+        if name == "other":
+            index["other"] = fname
+        else:
+            index["shards"].append([*ranges[name], fname])
+
+    index_blob = json.dumps(index, separators=(",", ":")).encode("utf-8")
+    changed = write_precompressed(os.path.join(out_dir, "index.json"), index_blob)
+    stale = [f for f in os.listdir(out_dir) if f not in files]
+    for f in stale:
+        os.remove(os.path.join(out_dir, f))
+
+    n = len(by_shard)
+    print(f"Built {n} shards: {raw / 1024:.0f} KB minified, {gz / 1024:.0f} KB gzip "
+          f"(largest {max(len(v) for v in by_shard.values())} entries)"
+          + ("" if brotli is not None else "; brotli not installed, no .br files"))
+    print(f"  -> {out_dir}/ ({written} shards written, "
+          f"{len(stale)} stale files removed, index {status(changed)})")
+
+
+def build_sprites():
+    """Write the atlas and the 囧 string -> sprite map for the web demo."""
+    atlas = load_atlas()
+    if atlas is None:
+        print("No primitive atlas (run crop_primitives.py); "
+              "skipping primitives.json")
+        return
+    sprites = {}
+    for jiong, keyword in jiong_primitives().items():
+        position = background_position(atlas, keyword)
+        if position:
+            sprites[jiong] = {"keyword": keyword, "position": position}
+    data = {
+        "image": os.path.basename(DOCS_ATLAS_OUT),
+        "size": background_size(atlas),
+        "sprites": sprites,
+    }
+
+    # Same palette-reduced copy the .apkg files embed
+    (optimized,) = optimize_media([ATLAS_PATH], max_size=None)
+    changed = write_bytes_if_changed(DOCS_ATLAS_OUT, Path(optimized).read_bytes())
+    print(f"Built primitives.png ({os.path.getsize(DOCS_ATLAS_OUT) / 1024:.1f} KB)")
+    print(f"  -> {DOCS_ATLAS_OUT} ({status(changed)})")
+    changed = write_text_if_changed(DOCS_SPRITES_OUT,
+                                    json.dumps(data, ensure_ascii=False, indent=1))
+    print(f"Built primitives.json with {len(sprites)} sprites")
+    print(f"  -> {DOCS_SPRITES_OUT} ({status(changed)})")
 
 
 def build():
@@ -34,14 +277,22 @@ def build():
             }
             data[char] = entry
 
-    for out_path in [ADDON_OUT, DOCS_OUT]:
-        os.makedirs(os.path.dirname(out_path), exist_ok=True)
-        with open(out_path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=1)
+    blob = dump_compact(encode_columnar(data))
+    changed = write_bytes_if_changed(ADDON_OUT, blob)
+    print(f"Built heisig_data.columns.json with {len(data)} entries "
+          f"({len(blob) / 1024:.0f} KB)")
+    print(f"  -> {ADDON_OUT} ({status(changed)})")
+
+    # Variant form -> canonical char, for variants without their own entry
+    variants = {char: v["canonical"] for char, v in load_variant_map().items()
+                if char not in data and v["canonical"] in data}
+    variants_json = json.dumps(variants, ensure_ascii=False, indent=1)
+    changed = write_text_if_changed(ADDON_VARIANTS_OUT, variants_json)
+    print(f"Built variants.json with {len(variants)} entries")
+    print(f"  -> {ADDON_VARIANTS_OUT} ({status(changed)})")
 
-    print(f"Built heisig_data.json with {len(data)} entries")
-    print(f"  -> {ADDON_OUT}")
-    print(f"  -> {DOCS_OUT}")
+    build_shards(data)
+    build_sprites()
 
 
 if __name__ == "__main__":
@@ -1,8 +1,11 @@
 """Build .apkg Anki decks with embedded primitive images.
 
 Reuses the card-building pipeline from build_decks.py, then packages
-everything into .apkg files using genanki. Non-unicode primitives (囧)
-are rendered as <img> tags referencing the PNGs from data/primitive_images/.
+everything into .apkg files using genanki (or, with --writer sqlite, the
+bulk writer in apkg_writer.py). Non-unicode primitives (囧) are shown as
+sprites from the atlas crop_primitives.py packs (one media file; see
+sprites.py), or as <img> tags referencing the PNGs in
+data/primitive_images/ if there is no atlas.
 
 Outputs:
   RTH_deck.apkg  — Traditional Hanzi + primitives
@@ -11,17 +14,32 @@ Outputs:
   Ultimate_deck.apkg — All 3 merged
 """
 
+import argparse
 import csv
+import hashlib
+import itertools
 import json
 import os
 import re
+import sqlite3
+import subprocess
 import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 import genanki
 
+import apkg_writer
+from artifacts import status, write_text_if_changed
+from optimize_media import MAX_SIZE, optimize_media
+from sprites import ATLAS_FILE, ATLAS_PATH, jiong_primitives, load_atlas, sprite_css, sprite_html
+
 ROOT = Path(__file__).resolve().parent.parent
 PRIM_IMAGES_DIR = ROOT / "data" / "primitive_images"
+RELEASES_DIR = ROOT / "data" / "releases"
 MANIFEST_PATH = PRIM_IMAGES_DIR / "manifest.json"
 
 # ── Load primitive image manifest ──────────────────────────────────────
@@ -30,62 +48,75 @@ if MANIFEST_PATH.exists():
     with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
         prim_manifest = json.load(f)
 
-# Build keyword -> image filename lookup
-# Also need: 囧 character string -> keyword mapping from rsh_parsed.json
-RSH_JSON = ROOT / "data" / "rsh_parsed.json"
-with open(RSH_JSON, "r", encoding="utf-8") as f:
-    rsh = json.load(f)
+# Sprite atlas coordinates, or None to embed one image per primitive
+atlas = load_atlas()
+
+# 囧 character string -> keyword mapping from rsh_parsed.json
+jiong_char_to_keyword = jiong_primitives()  # e.g. "囧只－口" -> "animal legs"
+jiong_keywords = set(jiong_char_to_keyword.values())
+
+
+# Image references as written by prim_img_tag()
+_IMG_SRC = re.compile(r'<img src="([^"]+)"')
+
 
-jiong_char_to_keyword = {}  # e.g. "囧只－口" -> "animal legs"
-jiong_keywords = set()
-for p in rsh["primitives"]:
-    if "囧" in p["character"]:
-        jiong_char_to_keyword[p["character"]] = p["keyword"]
-        jiong_keywords.add(p["keyword"])
+def in_atlas(keyword):
+    return atlas is not None and keyword in atlas["sprites"]
 
 
 def prim_img_tag(keyword):
-    """Return an <img> tag for a primitive keyword, or None."""
+    """Return the HTML showing a primitive keyword's image, or None.
+
+    A sprite from the atlas if it has one, otherwise an <img> tag.
+    """
     if keyword in prim_manifest:
         entry = prim_manifest[keyword]
-        fname = entry["file"]
         approx = " ≈" if entry.get("approximate") else ""
-        return f'<img src="{fname}">{approx}'
+        if in_atlas(keyword):
+            return sprite_html(atlas, keyword) + approx
+        return f'<img src="{entry["file"]}">{approx}'
     return None
 
 
+def media_references(field):
+    """Names of the media files a note field needs."""
+    refs = _IMG_SRC.findall(field)
+    if 'class="prim"' in field:
+        refs.append(ATLAS_FILE)
+    return refs
+
+
+# One alternation over every 囧 string that has an image, longest first so
+# a string is never cut short by a shorter one it starts with
+jiong_html = {}
+for _jiong, _kw in jiong_char_to_keyword.items():
+    _tag = prim_img_tag(_kw)
+    if _tag:
+        jiong_html[_jiong] = _tag
+_JIONG = re.compile("|".join(map(re.escape, sorted(jiong_html, key=len, reverse=True)))) if jiong_html else None
+# Whatever is left of a 囧 string after substitution
+# (a lone 囧 is the ordinary character "bright", not an encoded primitive)
+_JIONG_LEFT = re.compile(r'囧[^\s<>,="]+')
+
+
+def substitute_primitives(text, unmatched=None):
+    """Replace every known 囧 string in text with its <img> tag.
+
+    One linear scan per field. 囧 strings without an image are left as
+    they are and, if unmatched (a Counter) is given, counted there.
+    """
+    if "囧" not in text:
+        return text
+    if _JIONG is not None:
+        text = _JIONG.sub(lambda m: jiong_html[m.group()], text)
+    if unmatched is not None and "囧" in text:
+        unmatched.update(_JIONG_LEFT.findall(text))
+    return text
+
+
 def char_display(char):
     """Return HTML to display a character, using <img> for 囧 primitives."""
-    if "囧" in char:
-        kw = jiong_char_to_keyword.get(char)
-        if kw:
-            tag = prim_img_tag(kw)
-            if tag:
-                return tag
-    return char
-
-
-def enrich_components_detail(detail_str):
-    """Replace 囧 characters in components_detail with img tags."""
-    if not detail_str:
-        return detail_str
-    parts = detail_str.split(", ")
-    enriched = []
-    for part in parts:
-        if "=" in part:
-            ch, name = part.split(" = ", 1)
-            ch = ch.strip()
-            if "囧" in ch:
-                kw = jiong_char_to_keyword.get(ch)
-                if kw:
-                    tag = prim_img_tag(kw)
-                    if tag:
-                        enriched.append(f'{tag} = {name}')
-                        continue
-            enriched.append(part)
-        else:
-            enriched.append(part)
-    return ", ".join(enriched)
+    return substitute_primitives(char)
 
 
 # ── Anki model definition ─────────────────────────────────────────────
@@ -142,6 +173,16 @@ CARD_CSS = """\
   height: 24px;
   vertical-align: middle;
 }
+.character .prim {
+  width: 100px;
+  height: 100px;
+  vertical-align: middle;
+}
+.components .prim {
+  width: 24px;
+  height: 24px;
+  vertical-align: middle;
+}
 .spatial {
   font-size: 14px;
   color: #999;
@@ -164,6 +205,8 @@ CARD_CSS = """\
   color: #c0392b;
 }
 """
+if atlas is not None:
+    CARD_CSS += sprite_css(atlas)
 
 FRONT_TEMPLATE = """\
 <div class="character">{{Character}}</div>
@@ -235,36 +278,55 @@ def build_sort_field_map(cards):
     return sort_map
 
 
-def build_note(card, sort_map):
-    """Build a genanki Note from a card dict."""
-    char = card.get("character", "")
-    character_html = char_display(char)
-
-    # Enrich components_detail with img tags
-    components = enrich_components_detail(card.get("components_detail", ""))
+def note_fields(card, sort_map, unmatched=None):
+    """Return (fields, tags) of the note for a card dict.
 
+    囧 primitives are replaced with images in every field but SortField,
+    which must stay plain text for sorting.
+    """
+    char = card.get("character", "")
     sort_val = sort_map.get(char, card.get("keyword", char))
 
     tags_str = card.get("tags", "")
 
-    note = genanki.Note(
-        model=heisig_model,
-        fields=[
-            character_html,
-            card.get("keyword", ""),
-            card.get("reading", ""),
-            card.get("decomposition", ""),
-            components,
-            card.get("spatial", ""),
-            card.get("RTH_number", ""),
-            card.get("RSH_number", ""),
-            card.get("RTK_number", ""),
-            "",  # Heisig Explanation — filled by the add-on
-            sort_val,
-        ],
-        tags=tags_str.split() if tags_str else [],
-    )
-    return note
+    fields = [substitute_primitives(value, unmatched) for value in (
+        char,
+        card.get("keyword", ""),
+        card.get("reading", ""),
+        card.get("decomposition", ""),
+        card.get("components_detail", ""),
+        card.get("spatial", ""),
+        card.get("RTH_number", ""),
+        card.get("RSH_number", ""),
+        card.get("RTK_number", ""),
+        "",  # Heisig Explanation — filled by the add-on
+    )]
+    fields.append(sort_val)
+    return fields, tags_str.split() if tags_str else []
+
+
+def note_guid(deck_id, char):
+    """Stable note GUID from the deck identity and the character.
+
+    Independent of the note's content, so a re-imported note with new
+    fields updates the existing note instead of duplicating it.
+    """
+    return genanki.guid_for(deck_id, char)
+
+
+def note_digest(fields, tags):
+    """Content hash of a note, used to find changed notes between releases."""
+    return hashlib.sha1("\x1f".join(fields + [" ".join(tags)]).encode("utf-8")).hexdigest()
+
+
+def prepare_notes(deck_id, cards, sort_map, unmatched=None):
+    """(char, guid, fields, tags) for each card."""
+    notes = []
+    for card in cards:
+        char = card.get("character", "")
+        fields, tags = note_fields(card, sort_map, unmatched)
+        notes.append((char, note_guid(deck_id, char), fields, tags))
+    return notes
 
 
 def load_csv_cards(csv_path):
@@ -278,39 +340,238 @@ def load_csv_cards(csv_path):
 
 
 def collect_media_files():
-    """Collect all primitive image files that need to be embedded."""
+    """Collect all primitive image files that need to be embedded.
+
+    The atlas, plus separate images for any primitive it doesn't cover.
+    """
     media = []
+    if atlas is not None:
+        media.append(str(ATLAS_PATH))
     if PRIM_IMAGES_DIR.exists():
-        for entry in prim_manifest.values():
+        for keyword, entry in prim_manifest.items():
             img_path = PRIM_IMAGES_DIR / entry["file"]
-            if img_path.exists():
+            if img_path.exists() and not in_atlas(keyword):
                 media.append(str(img_path))
     return media
 
 
-def build_deck(name, csv_path, output_path):
-    """Build an .apkg file from a CSV deck."""
-    deck_id = DECK_IDS.get(name, hash(name) % (2**31))
-    deck = genanki.Deck(deck_id, f"Heisig::{name}")
+# Note timestamp when neither SOURCE_DATE_EPOCH nor git history is available
+# (2020-01-01 UTC)
+FALLBACK_TIMESTAMP = 1577836800
 
-    cards = load_csv_cards(csv_path)
-    # Drop entries with no keyword
-    cards = [c for c in cards if c.get("keyword", "").strip()]
-    sort_map = build_sort_field_map(cards)
-    for card in cards:
-        note = build_note(card, sort_map)
-        deck.add_note(note)
 
-    media = collect_media_files()
+def _last_commit_time(path):
+    """Unix time of the last commit touching path, or None outside git."""
+    try:
+        out = subprocess.run(["git", "log", "-1", "--format=%ct", "--", os.path.basename(path)],
+                             cwd=os.path.dirname(os.path.abspath(path)),
+                             capture_output=True, text=True, timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return int(out) if out.isdigit() else None
+
+
+def package_timestamp(csv_path):
+    """Timestamp for generated notes/cards.
+
+    Uses SOURCE_DATE_EPOCH when set, otherwise the time of the last commit
+    of the CSV, otherwise FALLBACK_TIMESTAMP. Never the file's mtime, which
+    a fresh clone sets to checkout time: the same commit always gives the
+    same .apkg, and the note mod times Anki uses on re-import only move
+    when the deck does.
+    """
+    epoch = os.environ.get("SOURCE_DATE_EPOCH")
+    if epoch:
+        return float(epoch)
+    return float(_last_commit_time(csv_path) or FALLBACK_TIMESTAMP)
+
+
+def write_genanki_db(deck, notes, db_path, timestamp):
+    """Write a collection through genanki Note objects."""
+    for _, guid, fields, tags in notes:
+        deck.add_note(genanki.Note(model=heisig_model, fields=fields, tags=tags, guid=guid))
+    conn = sqlite3.connect(db_path)
+    genanki.Package(deck).write_to_db(conn.cursor(), timestamp,
+                                      itertools.count(int(timestamp * 1000)))
+    conn.commit()
+    conn.close()
+
+
+def write_sqlite_db(deck, notes, db_path, timestamp):
+    """Write the same collection with the bulk SQLite writer."""
+    prepared = [(fields, apkg_writer.prepare_note(fields, tags, guid=guid))
+                for _, guid, fields, tags in notes]
+    apkg_writer.write_collection(db_path, heisig_model, deck, prepared, timestamp)
+
+
+WRITERS = {"genanki": write_genanki_db, "sqlite": write_sqlite_db}
+
+
+def write_apkg(name, notes, media, output_path, timestamp, writer):
+    """Write notes for deck `name` and media to output_path. Returns True if changed."""
+    deck = genanki.Deck(DECK_IDS.get(name, hash(name) % (2**31)), f"Heisig::{name}")
+    fd, db_path = tempfile.mkstemp(suffix=".anki2")
+    os.close(fd)
+    try:
+        WRITERS[writer](deck, notes, db_path, timestamp)
+        return apkg_writer.write_zip(db_path, media, output_path)
+    finally:
+        os.unlink(db_path)
+
+
+def release_path(name):
+    return RELEASES_DIR / f"{name}.json"
+
+
+def load_release(name):
+    """Note digests recorded for deck `name` at the last release, or None."""
+    path = release_path(name)
+    if not path.exists():
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def release_snapshot(name, notes, timestamp):
+    return {
+        "deck": name,
+        "timestamp": int(timestamp),
+        "notes": {char: note_digest(fields, tags) for char, _, fields, tags in notes},
+    }
+
+
+def write_delta(name, notes, media, output_path, timestamp, writer, release):
+    """Write an update .apkg with the notes added or changed since `release`.
+
+    Notes keep their GUIDs, so importing the update changes them in place.
+    A manifest listing added, changed and removed characters is written
+    next to it. Returns the manifest.
+    """
+    old = release["notes"]
+    current = release_snapshot(name, notes, timestamp)["notes"]
+    added = [c for c in current if c not in old]
+    changed = [c for c in current if c in old and old[c] != current[c]]
+    removed = [c for c in old if c not in current]
+
+    wanted = set(added) | set(changed)
+    delta_notes = [n for n in notes if n[0] in wanted]
+    # Only ship the images the updated notes reference
+    referenced = {m for _, _, fields, _ in delta_notes for f in fields for m in media_references(f)}
+    delta_media = [m for m in media if os.path.basename(m) in referenced]
+
+    manifest = {
+        "deck": name,
+        "since": release["timestamp"],
+        "timestamp": int(timestamp),
+        "package": output_path.name,
+        "added": added,
+        "changed": changed,
+        "removed": removed,
+        "media": [os.path.basename(m) for m in delta_media],
+    }
+    if delta_notes:
+        write_apkg(name, delta_notes, delta_media, output_path, timestamp, writer)
+    elif output_path.exists():
+        output_path.unlink()
+    write_text_if_changed(output_path.with_suffix(".json"),
+                          json.dumps(manifest, ensure_ascii=False, indent=2))
+    return manifest
+
+
+def build_deck(name, cards, media, output_path, timestamp, writer="genanki", delta=False):
+    """Build an .apkg file from loaded cards, plus an update package if delta.
+
+    Returns (number of cards, changed, seconds taken, delta manifest or None,
+    Counter of 囧 strings that had no image).
+    """
+    start = time.perf_counter()
+    deck_id = DECK_IDS.get(name, hash(name) % (2**31))
+    unmatched = Counter()
+    notes = prepare_notes(deck_id, cards, build_sort_field_map(cards), unmatched)
+    changed = write_apkg(name, notes, media, output_path, timestamp, writer)
 
-    pkg = genanki.Package(deck)
-    pkg.media_files = media
-    pkg.write_to_file(str(output_path))
+    manifest = None
+    if delta:
+        release = load_release(name)
+        if release is not None:
+            update_path = output_path.with_name(f"{output_path.stem}_update.apkg")
+            manifest = write_delta(name, notes, media, update_path, timestamp, writer, release)
+    return len(cards), changed, time.perf_counter() - start, manifest, unmatched
 
-    return len(cards)
+
+def mark_release(name, cards, timestamp):
+    """Record the note digests of deck `name` as the new release baseline."""
+    deck_id = DECK_IDS.get(name, hash(name) % (2**31))
+    notes = prepare_notes(deck_id, cards, build_sort_field_map(cards))
+    write_text_if_changed(release_path(name), json.dumps(
+        release_snapshot(name, notes, timestamp), ensure_ascii=False, indent=1))
+
+
+def benchmark_substitution(jobs, repeat=5):
+    """Time substitute_primitives() over every field of every card."""
+    texts = [value for _, (_, cards, *_) in jobs for card in cards for value in card.values() if value]
+    mb = sum(len(t.encode("utf-8")) for t in texts) / 1e6
+
+    def naive(text):
+        # One str.replace pass per known 囧 string, for comparison
+        for jiong, tag in jiong_html.items():
+            text = text.replace(jiong, tag)
+        return text
+
+    print(f"\n{len(texts)} fields, {mb:.1f} MB, {len(jiong_html)} 囧 strings with images")
+    for label, func in [("regex", substitute_primitives), ("per-string replace", naive)]:
+        best = min(_time_all(func, texts) for _ in range(repeat))
+        print(f"  {label:<20} {best:.3f}s  {len(texts) / best / 1e6:.2f}M fields/s  {mb / best:.0f} MB/s")
+
+
+def _time_all(func, texts):
+    start = time.perf_counter()
+    for text in texts:
+        func(text)
+    return time.perf_counter() - start
+
+
+def compare_writers(jobs):
+    """Build every deck with both writers; check parity and compare speed."""
+    ok = True
+    print(f"\n{'deck':<10} {'genanki':>9} {'sqlite':>9} {'speedup':>8}  parity")
+    for _, (name, cards, _, _, timestamp) in jobs:
+        notes = prepare_notes(DECK_IDS[name], cards, build_sort_field_map(cards))
+        rows, seconds = {}, {}
+        with tempfile.TemporaryDirectory() as tmp:
+            for writer, write in WRITERS.items():
+                deck = genanki.Deck(DECK_IDS[name], f"Heisig::{name}")
+                db_path = os.path.join(tmp, f"{writer}.anki2")
+                start = time.perf_counter()
+                write(deck, notes, db_path, timestamp)
+                seconds[writer] = time.perf_counter() - start
+                rows[writer] = apkg_writer.collection_rows(db_path)
+        diffs = [k for k in rows["genanki"] if rows["genanki"][k] != rows["sqlite"][k]]
+        ok &= not diffs
+        print(f"{name:<10} {seconds['genanki']:>8.2f}s {seconds['sqlite']:>8.2f}s "
+              f"{seconds['genanki'] / seconds['sqlite']:>7.1f}x  "
+              f"{'identical' if not diffs else 'DIFFERS: ' + ', '.join(diffs)}")
+    return ok
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Build .apkg Anki decks with embedded primitive images.")
+    parser.add_argument("-j", "--jobs", type=int,
+                        help="decks to build in parallel (default: one per CPU)")
+    parser.add_argument("--writer", choices=sorted(WRITERS), default="genanki",
+                        help="genanki (default) or the bulk SQLite writer in apkg_writer.py")
+    parser.add_argument("--compare-writers", action="store_true",
+                        help="build each deck with both writers, check parity and time them")
+    parser.add_argument("--benchmark-substitution", action="store_true",
+                        help="time the 囧 primitive substitution over all card fields")
+    parser.add_argument("--delta", action="store_true",
+                        help="also write <deck>_update.apkg with notes changed since the last release")
+    parser.add_argument("--raw-media", action="store_true",
+                        help="embed the rendered images as-is instead of the optimized copies")
+    parser.add_argument("--mark-release", action="store_true",
+                        help="record the current notes as the release that --delta compares against")
+    args = parser.parse_args()
+
     os.chdir(ROOT)
 
     decks = [
@@ -323,18 +584,69 @@ def main():
     print("Building .apkg decks...")
     print(f"Primitive images: {len(prim_manifest)} entries in manifest")
 
+    # Media and cards are loaded once here; workers only build and write
     media = collect_media_files()
-    print(f"Media files to embed: {len(media)}")
-
+    covered = f" (atlas covers {len(atlas['sprites'])} primitives)" if atlas else ""
+    print(f"Media files to embed: {len(media)}{covered}")
+    # Bytes per media file name, as rendered and as packaged
+    raw_size = {os.path.basename(m): os.path.getsize(m) for m in media}
+    if not args.raw_media:
+        # The atlas is quantized but keeps its size; its cells are already small
+        media = [optimize_media([m], max_size=None if os.path.basename(m) == ATLAS_FILE else MAX_SIZE)[0]
+                 for m in media]
+    packed_size = {os.path.basename(m): os.path.getsize(m) for m in media}
+
+    jobs = []
     for name, csv_file, apkg_file in decks:
         csv_path = ROOT / csv_file
         if not csv_path.exists():
             print(f"  SKIP {name}: {csv_file} not found (run build_decks.py first)")
             continue
-        n = build_deck(name, csv_path, ROOT / apkg_file)
-        print(f"  {apkg_file}: {n} cards")
-
-    print("\nDone!")
+        # Drop entries with no keyword
+        cards = [c for c in load_csv_cards(csv_path) if c.get("keyword", "").strip()]
+        jobs.append((apkg_file, (name, cards, media, ROOT / apkg_file, package_timestamp(csv_path))))
+
+    if args.compare_writers:
+        sys.exit(0 if compare_writers(jobs) else 1)
+    if args.benchmark_substitution:
+        benchmark_substitution(jobs)
+        return
+    if args.mark_release:
+        for _, (name, cards, _, _, timestamp) in jobs:
+            mark_release(name, cards, timestamp)
+            print(f"  {name}: release recorded in {release_path(name).relative_to(ROOT)}")
+        return
+
+    start = time.perf_counter()
+    workers = min(len(jobs), args.jobs or os.cpu_count() or 1)
+    if workers <= 1:
+        results = [build_deck(*job, args.writer, args.delta) for _, job in jobs]
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            futures = [pool.submit(build_deck, *job, args.writer, args.delta) for _, job in jobs]
+            results = [f.result() for f in futures]
+
+    def media_report(names):
+        before = sum(raw_size[n] for n in names)
+        after = sum(packed_size[n] for n in names)
+        saved = f", saved {(before - after) / 1024:.1f} KB" if before > after else ""
+        return f"media {after / 1024:.1f} KB{saved}"
+
+    unmatched = Counter()
+    for (apkg_file, _), (n, changed, seconds, delta, deck_unmatched) in zip(jobs, results):
+        unmatched.update(deck_unmatched)
+        print(f"  {apkg_file}: {n} cards, {media_report(raw_size)} in {seconds:.2f}s ({status(changed)})")
+        if delta:
+            print(f"    update since release: {len(delta['added'])} added, {len(delta['changed'])} changed, "
+                  f"{len(delta['removed'])} removed, {media_report(delta['media'])} -> {delta['package']}")
+        elif args.delta:
+            print("    no release recorded; run with --mark-release when publishing")
+    if unmatched:
+        print(f"\n囧 strings left as text (no primitive image): {len(unmatched)}")
+        for text, count in unmatched.most_common(20):
+            print(f"  {text} ({count}x)")
+    print(f"\nDone in {time.perf_counter() - start:.2f}s "
+          f"({workers} worker{'s' if workers != 1 else ''}, {args.writer} writer)")
 
 
 if __name__ == "__main__":
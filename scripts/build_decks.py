@@ -10,7 +10,11 @@ import csv
 import json
 import re
 import openpyxl
-from collections import defaultdict
+from contextlib import ExitStack
+
+from artifacts import AtomicOutput, status
+from cedict_index import load_index
+from variants import load_variant_map
 
 # ── Paths ──────────────────────────────────────────────────────────────
 EXCEL = "data/Heisig's Remembering the Kanji vs. Hanzi v27.xlsx"
@@ -36,6 +40,13 @@ IDS_LABELS = {
 }
 IDS_OPERATORS = set("⿰⿱⿲⿳⿴⿵⿶⿷⿸⿹⿺⿻⿼⿽⿾⿿〾")
 
+# ── Book membership bits (card["mask"]) ────────────────────────────────
+BOOK_RTH = 1
+BOOK_RSH = 2
+BOOK_RTK = 4
+ALL_BOOKS = BOOK_RTH | BOOK_RSH | BOOK_RTK  # primitives go in every deck
+BOOK_BITS = {"RTH": BOOK_RTH, "RSH": BOOK_RSH, "RTK": BOOK_RTK}
+
 # ══════════════════════════════════════════════════════════════════════
 # 1. Load data sources
 # ══════════════════════════════════════════════════════════════════════
@@ -68,49 +79,26 @@ with open(HUMAN_REVIEW, "r", encoding="utf-8") as f:
         if name:
             human_names[comp] = name
 
-# ── Radical mappings (same as recursive_decompose_v2) ──────────────────
-radical_map = {
-    '訁': '言', '糹': '糸', '釒': '金', '𥫗': '竹', '刂': '刀',
-    '彳': '行', '𤣩': '玉', '𧾷': '足', '罒': '网', '乚': '乙',
-    '飠': '食', '爫': '爪', '虍': '虎', '𧘇': '衣', '龶': '生',
-    '𦍌': '羊', '亍': '行', '牜': '牛', '覀': '西', '丬': '爿',
-    '䒑': '丷', '亻': '人', '氵': '水', '扌': '手', '忄': '心',
-    '犭': '犬', '礻': '示', '衤': '衣', '灬': '火', '⺌': '小',
-    '⺊': '卜', '讠': '言', '钅': '金', '饣': '食', '纟': '糸',
-    '贝': '貝', '车': '車', '见': '見', '门': '門', '鱼': '魚',
-    '马': '馬', '鸟': '鳥', '页': '頁', '风': '風', '⺝': '月',
-    '⺼': '月', '⺶': '羊', '⺀': '八', '⺄': '乙', '⺆': '冂',
-    '⺈': '刀',
-}
-for variant, parent in radical_map.items():
+# ── Variant classes (radical / trad / kanji forms, from build_mapping) ──
+# Unnamed variant forms borrow the keyword of their class's named member
+variant_map = load_variant_map()
+for variant, v in variant_map.items():
+    parent = v["canonical"]
     if variant not in heisig_by_char and parent in heisig_by_char:
         heisig_by_char[variant] = {
             "character": variant,
             "keyword": heisig_by_char[parent]["keyword"],
-            "type": "radical_variant",
+            "type": "radical_variant" if v["kind"] == "radical" else "variant",
             "primitive_aliases": heisig_by_char[parent]["primitive_aliases"],
             "components": [],
             "variant_of": parent,
         }
 
 # ── Excel workbook ─────────────────────────────────────────────────────
-wb = openpyxl.load_workbook(EXCEL)
+# Read-only mode streams rows from the file instead of building every cell
+wb = openpyxl.load_workbook(EXCEL, read_only=True)
 ws = wb["RTH+RSH+RTK"]
 
-# Trad/Kanji -> Simplified variant mapping into heisig_by_char
-for row in ws.iter_rows(min_row=2, values_only=True):
-    th, sh, k = row[3], row[4], row[5]
-    for char in [th, k]:
-        if char and sh and char != sh and char not in heisig_by_char and sh in heisig_by_char:
-            heisig_by_char[char] = {
-                "character": char,
-                "keyword": heisig_by_char[sh]["keyword"],
-                "type": "variant",
-                "primitive_aliases": heisig_by_char[sh]["primitive_aliases"],
-                "components": [],
-                "variant_of": sh,
-            }
-
 # ── IDS data ───────────────────────────────────────────────────────────
 # Numbered component definitions
 numbered_components = {}
@@ -138,19 +126,17 @@ with open(IDS_TXT, "r", encoding="utf-8-sig") as f:
             ids_map[parts[1]] = parts[2:]
 
 # ── CC-CEDICT from Excel ──────────────────────────────────────────────
-ws_cedict = wb["CC-CEDICT"]
-# Group readings by (TH, SH) pair
-cedict_by_char = defaultdict(list)  # char -> [(pinyin, definition)]
-for row in ws_cedict.iter_rows(min_row=2, values_only=True):
-    th, sh, pinyin, defn = row[0], row[1], row[2], row[3]
-    if not pinyin:
-        continue
-    for char in [th, sh]:
-        if char:
-            cedict_by_char[char].append((pinyin, defn or ""))
+def read_excel_cedict():
+    """Yield (TH, SH, pinyin, definition) rows from the CC-CEDICT sheet."""
+    for row in wb["CC-CEDICT"].iter_rows(min_row=2, values_only=True):
+        yield row[0], row[1], row[2], row[3]
+
+
+# Cached per-character readings, rebuilt only when the workbook changes
+cedict_index = load_index(EXCEL, read_excel_cedict)
 
 print(f"Loaded: {len(heisig_by_char)} Heisig chars, {len(ids_map)} IDS entries, "
-      f"{len(cedict_by_char)} CC-CEDICT chars, {len(unified)} unified mappings")
+      f"{len(cedict_index)} CC-CEDICT chars, {len(unified)} unified mappings")
 
 # ══════════════════════════════════════════════════════════════════════
 # 2. Helper functions
@@ -339,58 +325,16 @@ def format_component_html(ch, keyword, aliases, decomp_name):
 
 
 def format_reading(char):
-    """Format CC-CEDICT readings for a character.
-
-    Groups definitions by pinyin reading, limits to 3-4 meanings per reading,
-    filters obscure readings.
-    """
-    entries = cedict_by_char.get(char, [])
-    if not entries:
-        return ""
-
-    # Group by pinyin base (ignoring tone differences that are the same syllable)
-    by_pinyin = defaultdict(list)
-    for pinyin, defn in entries:
-        by_pinyin[pinyin].append(defn)
-
-    # Filter: skip surname-only or very obscure entries
-    # Keep max 4 readings, each with max 4 meanings
-    parts = []
-    for pinyin, defns in by_pinyin.items():
-        # Merge all definitions for this reading
-        all_meanings = []
-        for d in defns:
-            # Split on "/" which CC-CEDICT uses as separator
-            for m in d.split("/"):
-                m = m.strip()
-                if m and m not in all_meanings:
-                    all_meanings.append(m)
-
-        # Filter out surname-only entries if there are other readings
-        if len(by_pinyin) > 1 and len(all_meanings) <= 2:
-            if all(("surname" in m.lower() or "name" in m.lower()) for m in all_meanings):
-                continue
-
-        # Limit meanings
-        shown = all_meanings[:4]
-        parts.append(f"{pinyin}: {', '.join(shown)}")
-
-        if len(parts) >= 4:
-            break
-
-    return " | ".join(parts)
+    """Format CC-CEDICT readings for a character (precomputed by cedict_index)."""
+    entry = cedict_index.get(char)
+    return entry["reading"] if entry else ""
 
 
 # ══════════════════════════════════════════════════════════════════════
-# 3. Build card data from Excel
+# 3. Build card stubs from Excel
 # ══════════════════════════════════════════════════════════════════════
 
-# Collect all Excel row data
-excel_rows = []
-for row in ws.iter_rows(min_row=2, values_only=True):
-    excel_rows.append(row)
-
-# Build card dicts keyed by character
+# Card stubs keyed by character; enrichment happens while streaming (step 5)
 cards = {}  # char -> card dict
 
 def ensure_card(char):
@@ -406,47 +350,49 @@ def ensure_card(char):
             "spatial": "",
             "components_detail": "",
             "tags": [],
-            "books": set(),  # internal tracking
+            "books": 0,  # BOOK_* bits for books with a parsed number
+            "mask": 0,  # BOOK_* bits, decides which deck files get the card
         }
     return cards[char]
 
 
-for row in excel_rows:
+def parse_num(val):
+    """Parse a book number (numeric, or "ch # 0041" format for RSH)."""
+    if val is None:
+        return None
+    if isinstance(val, (int, float)):
+        return int(val)
+    m = re.match(r'ch\s*#\s*(\d+)', str(val))
+    if m:
+        return int(m.group(1))
+    return None
+
+
+for row in ws.iter_rows(min_row=2, values_only=True):
     rth_num, rsh_num, rtk_num = row[0], row[1], row[2]
     th, sh, k = row[3], row[4], row[5]
     rth_kw, rsh_kw, rtk_kw = row[7], row[8], row[9]
-    rth_read, th_read = row[10], row[11]
     rth_lesson, rsh_lesson, rtk_lesson = row[12], row[13], row[14]
 
-    # Parse RSH number (can be "ch # 0041" format or numeric)
-    def parse_num(val):
-        if val is None:
-            return None
-        if isinstance(val, (int, float)):
-            return int(val)
-        m = re.match(r'ch\s*#\s*(\d+)', str(val))
-        if m:
-            return int(m.group(1))
-        return None
-
-    rth_n = parse_num(rth_num)
-    rsh_n = parse_num(rsh_num)
-    rtk_n = parse_num(rtk_num)
-
     # Process each book's character
     book_entries = [
-        (th, rth_n, rth_kw, rth_lesson, "RTH"),
-        (sh, rsh_n, rsh_kw, rsh_lesson, "RSH"),
-        (k, rtk_n, rtk_kw, rtk_lesson, "RTK"),
+        (th, rth_num, rth_kw, rth_lesson, "RTH"),
+        (sh, rsh_num, rsh_kw, rsh_lesson, "RSH"),
+        (k, rtk_num, rtk_kw, rtk_lesson, "RTK"),
     ]
 
-    for char, num, kw, lesson, book in book_entries:
+    for char, raw_num, kw, lesson, book in book_entries:
         if not char:
             continue
         card = ensure_card(char)
 
+        # Deck membership follows the raw Excel cell, even if unparseable
+        if raw_num:
+            card["mask"] |= BOOK_BITS[book]
+
+        num = parse_num(raw_num)
         if num:
-            card["books"].add(book)
+            card["books"] |= BOOK_BITS[book]
             card[f"{book}_number"] = str(num)
 
         if kw and not card["keyword"]:
@@ -460,39 +406,93 @@ for row in excel_rows:
             # Convert "RSH1-L01" -> "RSH1::L01" for Anki nested tags
             card["tags"].append(lesson.replace("-", "::"))
 
+# The workbook is no longer needed (CC-CEDICT readings are in cedict_index)
+wb.close()
+del wb, ws
+
+
+# ══════════════════════════════════════════════════════════════════════
+# 4. Add standalone primitive card stubs
+# ══════════════════════════════════════════════════════════════════════
+
+def standalone_card(char, keyword, rsh_number=""):
+    return {
+        "character": char,
+        "keyword": keyword,
+        "RTH_number": "",
+        "RSH_number": rsh_number,
+        "RTK_number": "",
+        "tags": "primitive",
+        "mask": ALL_BOOKS,
+        "standalone": True,
+    }
+
+
+primitives_added = 0
+for entry in rsh["primitives"]:
+    char = entry["character"]
+    if char in cards:
+        continue  # already covered
+    # Standalone primitive not in any book's character list
+    aliases = entry["primitive_aliases"]
+    alias_str = f" (also: {', '.join(aliases)})" if aliases else ""
+    cards[char] = standalone_card(char, f"{entry['keyword']}{alias_str}")
+    primitives_added += 1
+
+# Also add character-primitives that might only be in RSH XML but not Excel
+for entry in rsh["characters"]:
+    char = entry["character"]
+    if char in cards:
+        continue
+    if not entry["primitive_aliases"]:
+        continue
+    rsh_number = str(entry["number"]) if entry.get("number") else ""
+    cards[char] = standalone_card(char, entry["keyword"], rsh_number)
+    primitives_added += 1
+
+print(f"Standalone primitives added: {primitives_added}")
+
 
 # ══════════════════════════════════════════════════════════════════════
-# 4. Enrich cards: decomposition, spatial, readings, primitives
+# 5. Enrich cards: decomposition, spatial, readings, primitives
 # ══════════════════════════════════════════════════════════════════════
 
-for char, card in cards.items():
+def format_components_detail(leaf_details):
+    """HTML lines for each distinct named component of a decomposition."""
+    detail_parts = []
+    seen_detail = set()
+    for ch, decomp_name in leaf_details:
+        if decomp_name and ch != "?" and ch not in seen_detail:
+            seen_detail.add(ch)
+            if ch in heisig_by_char:
+                keyword = heisig_by_char[ch].get("keyword", decomp_name)
+                aliases = heisig_by_char[ch].get("primitive_aliases", [])
+            else:
+                keyword = decomp_name
+                aliases = []
+            detail_parts.append(format_component_html(ch, keyword, aliases, decomp_name))
+    return "<br>".join(detail_parts)
+
+
+def enrich_book_card(card):
+    """Fill in a card built from the Excel book rows."""
+    char = card["character"]
+    books = card.pop("books")
+
     # Deck column: which book(s) this character belongs to
-    card["deck"] = " ".join(sorted(card["books"])) if card["books"] else ""
+    card["deck"] = " ".join(b for b in sorted(BOOK_BITS) if books & BOOK_BITS[b])
 
     # Reading from CC-CEDICT (skip for RTK-only / kanji-only)
-    if "RTH" in card["books"] or "RSH" in card["books"]:
+    if books & (BOOK_RTH | BOOK_RSH):
         card["reading"] = format_reading(char)
 
     # Decomposition + components_detail
     tree = recursive_decompose(char)
     leaves = collect_leaves(tree)
-    leaf_details = collect_leaf_details(tree)
 
     if tree.get("source") == "heisig" or (tree.get("children") and len(leaves) > 0):
         card["decomposition"] = " + ".join(leaves)
-        detail_parts = []
-        seen_detail = set()
-        for ch, decomp_name in leaf_details:
-            if decomp_name and ch != "?" and ch not in seen_detail:
-                seen_detail.add(ch)
-                if ch in heisig_by_char:
-                    keyword = heisig_by_char[ch].get("keyword", decomp_name)
-                    aliases = heisig_by_char[ch].get("primitive_aliases", [])
-                else:
-                    keyword = decomp_name
-                    aliases = []
-                detail_parts.append(format_component_html(ch, keyword, aliases, decomp_name))
-        card["components_detail"] = "<br>".join(detail_parts)
+        card["components_detail"] = format_components_detail(collect_leaf_details(tree))
     elif tree.get("source") == "heisig_atomic":
         card["decomposition"] = ""  # atomic, no sub-components
         card["components_detail"] = ""
@@ -508,102 +508,40 @@ for char, card in cards.items():
         entry = heisig_by_char[char]
         if entry.get("type") == "primitive" or entry.get("primitive_aliases"):
             card["tags"].append("primitive")
+            card["mask"] = ALL_BOOKS
 
     card["tags"] = " ".join(sorted(set(card["tags"])))
 
 
-# ══════════════════════════════════════════════════════════════════════
-# 5. Add standalone primitive cards
-# ══════════════════════════════════════════════════════════════════════
-
-primitives_added = 0
-for entry in rsh["primitives"]:
-    char = entry["character"]
-    if char in cards:
-        continue  # already covered
-    # Standalone primitive not in any book's character list
+def enrich_standalone_card(card):
+    """Fill in a standalone primitive card (not in any book's character list)."""
+    char = card["character"]
+    del card["standalone"]
     tree = recursive_decompose(char)
-    leaves = collect_leaves(tree)
-    leaf_details = collect_leaf_details(tree)
+    has_children = bool(tree.get("children"))
 
-    aliases = entry["primitive_aliases"]
-    kw = entry["keyword"]
-    alias_str = f" (also: {', '.join(aliases)})" if aliases else ""
+    card["reading"] = format_reading(char)
+    card["decomposition"] = " + ".join(collect_leaves(tree)) if has_children else ""
+    card["spatial"] = get_top_operator(char)
+    card["ids"] = get_raw_ids(char)
+    card["components_detail"] = (format_components_detail(collect_leaf_details(tree))
+                                 if has_children else "")
 
-    card = {
-        "character": char,
-        "keyword": f"{kw}{alias_str}",
-        "RTH_number": "",
-        "RSH_number": "",
-        "RTK_number": "",
-        "reading": format_reading(char),
-        "decomposition": " + ".join(leaves) if tree.get("children") else "",
-        "spatial": get_top_operator(char),
-        "ids": get_raw_ids(char),
-        "components_detail": "",
-        "tags": "primitive",
-    }
-    if tree.get("children"):
-        detail_parts = []
-        seen_detail = set()
-        for ch, decomp_name in leaf_details:
-            if decomp_name and ch != "?" and ch not in seen_detail:
-                seen_detail.add(ch)
-                if ch in heisig_by_char:
-                    keyword = heisig_by_char[ch].get("keyword", decomp_name)
-                    aliases = heisig_by_char[ch].get("primitive_aliases", [])
-                else:
-                    keyword = decomp_name
-                    aliases = []
-                detail_parts.append(format_component_html(ch, keyword, aliases, decomp_name))
-        card["components_detail"] = "<br>".join(detail_parts)
-
-    cards[char] = card
-    primitives_added += 1
 
-# Also add character-primitives that might only be in RSH XML but not Excel
-for entry in rsh["characters"]:
-    char = entry["character"]
-    if char in cards:
-        continue
-    if not entry["primitive_aliases"]:
-        continue
-    tree = recursive_decompose(char)
-    leaves = collect_leaves(tree)
-    leaf_details = collect_leaf_details(tree)
+def enriched_cards():
+    """Yield enriched cards in character order.
 
-    card = {
-        "character": char,
-        "keyword": entry["keyword"],
-        "RTH_number": "",
-        "RSH_number": str(entry["number"]) if entry.get("number") else "",
-        "RTK_number": "",
-        "reading": format_reading(char),
-        "decomposition": " + ".join(leaves) if tree.get("children") else "",
-        "spatial": get_top_operator(char),
-        "ids": get_raw_ids(char),
-        "components_detail": "",
-        "tags": "primitive",
-    }
-    if tree.get("children"):
-        detail_parts = []
-        seen_detail = set()
-        for ch, decomp_name in leaf_details:
-            if decomp_name and ch != "?" and ch not in seen_detail:
-                seen_detail.add(ch)
-                if ch in heisig_by_char:
-                    keyword = heisig_by_char[ch].get("keyword", decomp_name)
-                    aliases = heisig_by_char[ch].get("primitive_aliases", [])
-                else:
-                    keyword = decomp_name
-                    aliases = []
-                detail_parts.append(format_component_html(ch, keyword, aliases, decomp_name))
-        card["components_detail"] = "<br>".join(detail_parts)
-
-    cards[char] = card
-    primitives_added += 1
+    Each stub is removed from `cards` as it is yielded, so only the card
+    currently being written (and its decomposition tree) is fully built.
+    """
+    for char in sorted(cards):
+        card = cards.pop(char)
+        if card.get("standalone"):
+            enrich_standalone_card(card)
+        else:
+            enrich_book_card(card)
+        yield card
 
-print(f"Standalone primitives added: {primitives_added}")
 
 # ══════════════════════════════════════════════════════════════════════
 # 6. Output CSVs
@@ -612,39 +550,65 @@ print(f"Standalone primitives added: {primitives_added}")
 COLUMNS = ["character", "keyword", "RTH_number", "RSH_number", "RTK_number",
            "reading", "decomposition", "spatial", "ids", "components_detail", "deck", "tags"]
 
+SPOT_CHECKS = {"虎": "magic wand", "國": "pent in"}
+stats = {"total": 0, "primitives": 0, "spot": {}}
 
-def write_deck(filename, filter_fn):
-    """Write a CSV deck, filtering cards by filter_fn."""
-    rows = []
-    for char, card in sorted(cards.items(), key=lambda x: x[0]):
-        if filter_fn(card):
-            rows.append([card.get(col, "") for col in COLUMNS])
-
-    with open(filename, "w", encoding="utf-8", newline="") as f:
-        writer = csv.writer(f)
-        writer.writerow(COLUMNS)
-        writer.writerows(rows)
 
-    return len(rows)
+def tracked(card_iter):
+    """Pass cards through while collecting the summary statistics."""
+    for card in card_iter:
+        stats["total"] += 1
+        if "primitive" in card.get("tags", ""):
+            stats["primitives"] += 1
+        if card["character"] in SPOT_CHECKS:
+            stats["spot"][card["character"]] = card["decomposition"]
+        yield card
 
 
-# Collect which characters belong to which books from Excel
-rth_chars = set()
-rsh_chars = set()
-rtk_chars = set()
-for row in excel_rows:
-    if row[0] and row[3]:  # RTH number + TH char
-        rth_chars.add(row[3])
-    if row[1] and row[4]:  # RSH number + SH char
-        rsh_chars.add(row[4])
-    if row[2] and row[5]:  # RTK number + K char
-        rtk_chars.add(row[5])
+def write_decks(card_iter, sinks):
+    """Write every CSV deck in a single pass over card_iter (sorted cards).
 
-is_primitive = lambda c: "primitive" in c.get("tags", "")
-n_rth = write_deck("RTH_deck.csv", lambda c: c["character"] in rth_chars or is_primitive(c))
-n_rsh = write_deck("RSH_deck.csv", lambda c: c["character"] in rsh_chars or is_primitive(c))
-n_rtk = write_deck("RTK_deck.csv", lambda c: c["character"] in rtk_chars or is_primitive(c))
-n_ult = write_deck("Ultimate_deck.csv", lambda c: True)
+    sinks is a list of (filename, mask) pairs; a card goes to a file when
+    its book mask overlaps the sink's mask (mask None takes every card).
+    Files are only replaced when their content changes.
+    Returns the row count per file.
+    """
+    counts = {filename: 0 for filename, _ in sinks}
+    atomic = {filename: AtomicOutput(filename, "w", encoding="utf-8", newline="")
+              for filename, _ in sinks}
+    with ExitStack() as stack:
+        outputs = []
+        for filename, mask in sinks:
+            f = stack.enter_context(atomic[filename])
+            writer = csv.writer(f)
+            writer.writerow(COLUMNS)
+            outputs.append((filename, mask, writer))
+
+        for card in card_iter:
+            card_mask = card["mask"]
+            row = None
+            for filename, mask, writer in outputs:
+                if mask is None or card_mask & mask:
+                    if row is None:
+                        row = [card.get(col, "") for col in COLUMNS]
+                    writer.writerow(row)
+                    counts[filename] += 1
+
+    for filename, out in atomic.items():
+        print(f"  {filename}: {status(out.changed)}")
+    return counts
+
+
+counts = write_decks(tracked(enriched_cards()), [
+    ("RTH_deck.csv", BOOK_RTH),
+    ("RSH_deck.csv", BOOK_RSH),
+    ("RTK_deck.csv", BOOK_RTK),
+    ("Ultimate_deck.csv", None),
+])
+n_rth = counts["RTH_deck.csv"]
+n_rsh = counts["RSH_deck.csv"]
+n_rtk = counts["RTK_deck.csv"]
+n_ult = counts["Ultimate_deck.csv"]
 
 # ══════════════════════════════════════════════════════════════════════
 # 7. Summary
@@ -658,15 +622,13 @@ print(f"  Ultimate_deck.csv: {n_ult} cards")
 print(f"{'='*60}")
 
 # Spot checks
-for ch, expected in [("虎", "magic wand"), ("國", "pent in")]:
-    card = cards.get(ch)
-    if card:
-        decomp = card["decomposition"]
+for ch, expected in SPOT_CHECKS.items():
+    if ch in stats["spot"]:
+        decomp = stats["spot"][ch]
         has = expected in decomp if decomp else False
-        status = "OK" if has else "MISSING"
-        print(f"  Spot check {ch}: decomposition = '{decomp}' [{status}]")
+        status_label = "OK" if has else "MISSING"
+        print(f"  Spot check {ch}: decomposition = '{decomp}' [{status_label}]")
 
 # Primitive count
-prim_count = sum(1 for c in cards.values() if "primitive" in c.get("tags", ""))
-print(f"  Primitive-tagged cards: {prim_count}")
-print(f"  Total unique characters: {len(cards)}")
+print(f"  Primitive-tagged cards: {stats['primitives']}")
+print(f"  Total unique characters: {stats['total']}")
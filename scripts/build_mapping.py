@@ -2,16 +2,21 @@
 
 Strategy:
 1. Start with everything named in RSH XML (characters + primitives + aliases)
-2. Map CJK radical variants to their parent characters (e.g. 讠-> 言)
-3. Map traditional/simplified variants to each other
+2-3. Resolve CJK radical variants (e.g. 讠-> 言) and traditional/kanji/
+   simplified variants as one set of equivalence classes (variants.py)
 4. Decompose all Excel characters via IDS
 5. Report what's still unmapped
 """
 import json
 import re
 import unicodedata
+from collections import Counter
+
 import openpyxl
 
+from artifacts import write_text_if_changed
+from variants import VARIANT_MAP_PATH, build_variant_table
+
 # Load RSH parsed data
 with open("data/rsh_parsed.json", "r", encoding="utf-8") as f:
     rsh = json.load(f)
@@ -37,104 +42,34 @@ for entry in rsh["characters"] + rsh["primitives"]:
 
 print(f"Heisig named entries: {len(heisig_name)}")
 
-# --- Step 2: CJK Compatibility / Radical mappings ---
-# Unicode has a "CJK Radicals Supplement" block (2E80-2EFF) and
-# "Kangxi Radicals" (2F00-2FDF) that map to CJK unified chars.
-# We can use Unicode decomposition mappings.
-
-radical_to_parent = {}
-
-# Method 1: Unicode decomposition mapping
-for cp in range(0x2E80, 0x2FE0):
-    ch = chr(cp)
-    decomp = unicodedata.decomposition(ch)
-    if decomp:
-        # Format like "2F00" or "compat 2F00"
-        parts = decomp.split()
-        # Get the last hex value
-        hex_val = parts[-1]
-        try:
-            parent = chr(int(hex_val, 16))
-            radical_to_parent[ch] = parent
-        except ValueError:
-            pass
-
-# Method 2: Known manual mappings for common simplified radicals
-# These are simplified forms that appear as components
-manual_radical_map = {
-    '讠': '言',  # speech
-    '钅': '金',  # metal
-    '饣': '食',  # food
-    '纟': '糸',  # thread
-    '贝': '貝',  # shell
-    '车': '車',  # vehicle
-    '见': '見',  # see
-    '门': '門',  # gate
-    '鱼': '魚',  # fish
-    '马': '馬',  # horse
-    '鸟': '鳥',  # bird
-    '页': '頁',  # page
-    '风': '風',  # wind
-    '韦': '韋',  # leather
-    '长': '長',  # long
-    '齿': '齒',  # teeth
-    '龙': '龍',  # dragon
-    '龟': '龜',  # turtle
-    '亻': '人',  # person (side)
-    '氵': '水',  # water (side)
-    '扌': '手',  # hand (side)
-    '忄': '心',  # heart (side)
-    '犭': '犬',  # dog (side)
-    '礻': '示',  # spirit/show (side)
-    '衤': '衣',  # clothing (side)
-    '⺗': '心',  # heart variant
-    '⺝': '月',  # moon/flesh variant
-    '⺼': '月',  # meat/flesh radical -> month (same in heisig)
-    '⺶': '羊',  # sheep variant
-    '灬': '火',  # fire dots (but Heisig calls this "cooking fire" separately)
-    '⺌': '小',  # small top
-    '⺊': '卜',  # divination
-    '⺀': '八',  # eight variant
-    '⺄': '乙',  # second variant
-    '⺆': '冂',  # hood variant
-    '⺈': '刀',  # knife variant
-}
-
-# Apply radical->parent, then check if parent has a Heisig name
-mapped_via_radical = {}
-for rad, parent in {**radical_to_parent, **manual_radical_map}.items():
-    if rad not in heisig_name and parent in heisig_name:
-        mapped_via_radical[rad] = (parent, heisig_name[parent])
-
-print(f"Radicals mapped to Heisig via parent char: {len(mapped_via_radical)}")
-
-# --- Step 3: Trad/Simplified cross-mapping from Excel ---
-wb = openpyxl.load_workbook("data/Heisig's Remembering the Kanji vs. Hanzi v27.xlsx")
+# --- Step 2/3: Radical and trad/kanji -> simplified variant classes ---
+# Radical edges (Unicode decompositions + RADICAL_MAP) and the Excel
+# trad->simp / kanji->simp pairs are resolved together by union-find, so
+# chains like traditional -> simplified -> radical form are followed.
+wb = openpyxl.load_workbook("data/Heisig's Remembering the Kanji vs. Hanzi v27.xlsx",
+                            read_only=True)
 ws = wb["RTH+RSH+RTK"]
 
-trad_to_simp = {}
-simp_to_trad = {}
-kanji_to_simp = {}
-
+variant_pairs = []
+n_trad = n_kanji = 0
 for row in ws.iter_rows(min_row=2, values_only=True):
     th, sh, k = row[3], row[4], row[5]
     if th and sh and th != sh:
-        trad_to_simp[th] = sh
-        simp_to_trad[sh] = th
+        variant_pairs.append((th, sh))
+        n_trad += 1
     if k and sh and k != sh:
-        kanji_to_simp[k] = sh
+        variant_pairs.append((k, sh))
+        n_kanji += 1
 
-print(f"Trad->Simp pairs: {len(trad_to_simp)}")
-print(f"Kanji->Simp pairs (where different): {len(kanji_to_simp)}")
+print(f"Trad->Simp pairs: {n_trad}")
+print(f"Kanji->Simp pairs (where different): {n_kanji}")
 
-# For trad/kanji chars not in Heisig, try mapping through simplified
-mapped_via_variant = {}
-for char_map in [trad_to_simp, kanji_to_simp]:
-    for char, simp in char_map.items():
-        if char not in heisig_name and simp in heisig_name:
-            mapped_via_variant[char] = (simp, heisig_name[simp])
+variant_map = build_variant_table(heisig_name, variant_pairs)
+mapped_via_radical = {c: v["canonical"] for c, v in variant_map.items() if v["kind"] == "radical"}
+mapped_via_variant = {c: v["canonical"] for c, v in variant_map.items() if v["kind"] == "variant"}
 
-print(f"Trad/Kanji chars mapped to Heisig via simplified: {len(mapped_via_variant)}")
+print(f"Radicals mapped to Heisig via parent char: {len(mapped_via_radical)}")
+print(f"Trad/Kanji chars mapped to Heisig via variant class: {len(mapped_via_variant)}")
 
 # --- Step 4: Parse IDS for all Excel characters ---
 ids_map = {}
@@ -214,21 +149,20 @@ for char, name in heisig_name.items():
     }
 
 # Secondary: radical -> parent mapping
-for rad, (parent, name) in mapped_via_radical.items():
+for rad, parent in mapped_via_radical.items():
     unified[rad] = {
-        "name": name,
+        "name": heisig_name[parent],
         "aliases": heisig_aliases.get(parent, []),
         "source": f"radical_of:{parent}",
     }
 
-# Tertiary: trad/kanji -> simplified mapping
-for char, (simp, name) in mapped_via_variant.items():
-    if char not in unified:
-        unified[char] = {
-            "name": name,
-            "aliases": heisig_aliases.get(simp, []),
-            "source": f"variant_of:{simp}",
-        }
+# Tertiary: trad/kanji -> named member of the variant class
+for char, canon in mapped_via_variant.items():
+    unified[char] = {
+        "name": heisig_name[canon],
+        "aliases": heisig_aliases.get(canon, []),
+        "source": f"variant_of:{canon}",
+    }
 
 print(f"\nUnified lookup size: {len(unified)}")
 
@@ -239,86 +173,91 @@ for row in ws.iter_rows(min_row=2, values_only=True):
         if row[col]:
             all_excel.add(row[col])
 
-fully_mapped = 0  # char is in unified AND all its IDS components are in unified
-partially_mapped = 0
-unmapped_chars = 0
-unmapped_components = set()
-unmapped_detail = []
-
-for char in sorted(all_excel):
-    char_known = char in unified
 
-    if char in ids_map:
-        tree = parse_ids(ids_map[char][0])
-        leaves = get_leaf_components(tree)
-        unknown_leaves = [l for l in leaves if l not in unified and l != char]
+def categorize(c):
+    """Unicode category of a component for the unmapped breakdown."""
+    cp = ord(c)
+    if 0x31C0 <= cp <= 0x31EF:
+        return "strokes"
+    if 0x2E80 <= cp <= 0x2FDF:
+        return "radicals"
+    if (0x4E00 <= cp <= 0x9FFF or 0x3400 <= cp <= 0x4DBF or
+            0x20000 <= cp <= 0x2FA1F):
+        return "cjk_chars"
+    return "other"
+
+
+def coverage_report(chars, leaves_by_char, known):
+    """Answer every coverage question from the cached leaf lists.
+
+    chars: characters to report on (iterated in sorted order)
+    leaves_by_char: char -> leaf components (only chars that have IDS)
+    known: mapping of already-named characters
+    """
+    report = {"fully_mapped": 0, "partially_mapped": 0, "unmapped_chars": 0}
+    unmapped_components = set()
+
+    for char in chars:
+        char_known = char in known
+        leaves = leaves_by_char.get(char)
+        if leaves is None:
+            report["fully_mapped" if char_known else "unmapped_chars"] += 1
+            continue
 
+        unknown_leaves = [l for l in leaves if l not in known and l != char]
         if char_known and not unknown_leaves:
-            fully_mapped += 1
+            report["fully_mapped"] += 1
         elif char_known or not unknown_leaves:
-            partially_mapped += 1
+            report["partially_mapped"] += 1
         else:
-            unmapped_chars += 1
+            report["unmapped_chars"] += 1
+        unmapped_components.update(unknown_leaves)
 
-        for l in unknown_leaves:
-            unmapped_components.add(l)
-    else:
-        if char_known:
-            fully_mapped += 1
-        else:
-            unmapped_chars += 1
+    # Frequency of each unmapped component across all decompositions
+    comp_freq = Counter()
+    for char in chars:
+        for l in leaves_by_char.get(char, ()):
+            if l in unmapped_components:
+                comp_freq[l] += 1
+
+    categories = {"strokes": set(), "radicals": set(), "cjk_chars": set(), "other": set()}
+    for c in unmapped_components:
+        categories[categorize(c)].add(c)
+
+    report["unmapped_components"] = unmapped_components
+    report["comp_freq"] = comp_freq
+    report["categories"] = categories
+    return report
+
+
+# Each character is parsed from IDS exactly once; the report reuses the leaves
+excel_chars = sorted(all_excel)
+leaves_by_char = {char: get_leaf_components(parse_ids(ids_map[char][0]))
+                  for char in excel_chars if char in ids_map}
+report = coverage_report(excel_chars, leaves_by_char, unified)
+unmapped_components = report["unmapped_components"]
+comp_freq = report["comp_freq"]
+categories = report["categories"]
 
 print(f"\nDecomposition coverage for {len(all_excel)} Excel characters:")
-print(f"  Fully mapped (char + all components named):  {fully_mapped}")
-print(f"  Partially mapped:                            {partially_mapped}")
-print(f"  Unmapped:                                    {unmapped_chars}")
+print(f"  Fully mapped (char + all components named):  {report['fully_mapped']}")
+print(f"  Partially mapped:                            {report['partially_mapped']}")
+print(f"  Unmapped:                                    {report['unmapped_chars']}")
 print(f"\nUnique unmapped components: {len(unmapped_components)}")
 
-# Categorize unmapped components
-strokes = set()
-radicals = set()
-cjk_chars = set()
-other = set()
-
-for c in unmapped_components:
-    cp = ord(c)
-    if 0x31C0 <= cp <= 0x31EF:
-        strokes.add(c)
-    elif 0x2E80 <= cp <= 0x2FDF:
-        radicals.add(c)
-    elif (0x4E00 <= cp <= 0x9FFF or 0x3400 <= cp <= 0x4DBF or
-          0x20000 <= cp <= 0x2FA1F):
-        cjk_chars.add(c)
-    else:
-        other.add(c)
-
-print(f"  Strokes:            {len(strokes)}")
-print(f"  Radical forms:      {len(radicals)}")
-print(f"  CJK characters:     {len(cjk_chars)}")
-print(f"  Other:              {len(other)}")
+print(f"  Strokes:            {len(categories['strokes'])}")
+print(f"  Radical forms:      {len(categories['radicals'])}")
+print(f"  CJK characters:     {len(categories['cjk_chars'])}")
+print(f"  Other:              {len(categories['other'])}")
 
 # Show the most frequently used unmapped components
-from collections import Counter
-comp_freq = Counter()
-for char in all_excel:
-    if char in ids_map:
-        tree = parse_ids(ids_map[char][0])
-        leaves = get_leaf_components(tree)
-        for l in leaves:
-            if l in unmapped_components:
-                comp_freq[l] += 1
-
 print(f"\nTop 30 most-used unmapped components:")
 for comp, count in comp_freq.most_common(30):
     cp = ord(comp)
     name = unicodedata.name(comp, "?")
     print(f"  {comp} (U+{cp:04X}) used {count}x - {name}")
 
-# Save unified mapping
-with open("data/unified_mapping.json", "w", encoding="utf-8") as f:
-    json.dump(unified, f, ensure_ascii=False, indent=2)
-
-# Save unmapped components for manual review
+# Unmapped components for manual review
 unmapped_for_review = []
 for comp, count in comp_freq.most_common():
     cp = ord(comp)
@@ -332,8 +271,14 @@ for comp, count in comp_freq.most_common():
         "ids": ids_decomp,
     })
 
-with open("data/unmapped_components.json", "w", encoding="utf-8") as f:
-    json.dump(unmapped_for_review, f, ensure_ascii=False, indent=2)
+# Save all outputs together
+write_text_if_changed("data/unified_mapping.json",
+                      json.dumps(unified, ensure_ascii=False, indent=2))
+write_text_if_changed(VARIANT_MAP_PATH,
+                      json.dumps(variant_map, ensure_ascii=False, indent=2))
+write_text_if_changed("data/unmapped_components.json",
+                      json.dumps(unmapped_for_review, ensure_ascii=False, indent=2))
 
 print(f"\nSaved: data/unified_mapping.json ({len(unified)} entries)")
 print(f"Saved: data/unmapped_components.json ({len(unmapped_for_review)} entries for review)")
+print(f"Saved: data/variant_map.json ({len(variant_map)} variant entries)")
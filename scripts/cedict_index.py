@@ -0,0 +1,165 @@
+"""Shared CC-CEDICT index used by build_decks.py and generate_keywords.py.
+
+Entries are parsed once into a per-character index:
+
+  char -> {
+    "pinyin":  first reading seen (used alongside generated keywords),
+    "defs":    de-duplicated keyword candidates, in dictionary order,
+    "reading": formatted reading string for the card "reading" column,
+  }
+
+The index is cached under data/cache/ and rebuilt only when the SHA-256
+of the source file (cedict.txt or the Excel workbook) changes.
+"""
+
+import json
+import re
+from pathlib import Path
+
+from artifacts import file_sha256, write_text_if_changed
+
+ROOT = Path(__file__).resolve().parent.parent
+CEDICT_PATH = ROOT / "data" / "cedict.txt"
+CACHE_DIR = ROOT / "data" / "cache"
+
+# Bump when the index layout or formatting rules change
+INDEX_VERSION = 1
+
+MAX_READINGS = 4
+MAX_MEANINGS = 4
+
+_SKIP_DEF = re.compile(r"^(variant of|see |also written|abbr\. for|same as)", re.I)
+_LEADING_NOTE = re.compile(r"^\([^)]+\)\s*")
+
+
+def read_cedict_txt(path=CEDICT_PATH):
+    """Yield (trad, simp, pinyin, defs_str) for single-character entries.
+
+    Format: 傳統 简体 [pinyin] /def1/def2/
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line or line[0] == "#":
+                continue
+            parts = line.split(None, 2)
+            if len(parts) < 3:
+                continue
+            trad, simp, rest = parts
+            if len(trad) != 1 and len(simp) != 1:
+                continue  # multi-character word
+            if rest[0] != "[":
+                continue
+            close = rest.find("]")
+            start = rest.find("/", close + 1)
+            end = rest.rfind("/")
+            if close < 0 or start < 0 or end <= start + 1:
+                continue
+            yield trad, simp, rest[1:close], rest[start + 1:end]
+
+
+def keyword_candidates(defs_str):
+    """Split a CEDICT definition string into keyword candidates.
+
+    Drops pure variant references, strips leading parenthetical notes and
+    splits on semicolons (e.g. "to gnaw; to bite").
+    """
+    result = []
+    for d in defs_str.split("/"):
+        d = d.strip()
+        if not d or _SKIP_DEF.match(d):
+            continue
+        d = _LEADING_NOTE.sub("", d)
+        for sub in d.split(";"):
+            sub = sub.strip()
+            if sub:
+                result.append(sub)
+    return result
+
+
+def format_reading(by_pinyin):
+    """Format {pinyin: meanings} as "pinyin: m1, m2 | pinyin: ...".
+
+    Skips surname-only readings when other readings exist and limits output
+    to MAX_READINGS readings of MAX_MEANINGS meanings each.
+    """
+    parts = []
+    for pinyin, meanings in by_pinyin.items():
+        if len(by_pinyin) > 1 and len(meanings) <= 2:
+            if all(("surname" in m.lower() or "name" in m.lower()) for m in meanings):
+                continue
+        parts.append(f"{pinyin}: {', '.join(meanings[:MAX_MEANINGS])}")
+        if len(parts) >= MAX_READINGS:
+            break
+    return " | ".join(parts)
+
+
+def build_index(entries):
+    """Build the per-character index from (trad, simp, pinyin, defs_str) tuples."""
+    pinyin_of = {}
+    defs = {}      # char -> dict used as an ordered set
+    readings = {}  # char -> {pinyin: dict used as an ordered set}
+    for trad, simp, pinyin, defs_str in entries:
+        if not pinyin:
+            continue
+        defs_str = defs_str or ""
+        candidates = None
+        meanings = None
+        for char in (trad, simp):
+            if not char or len(char) != 1:
+                continue
+            if candidates is None:
+                candidates = keyword_candidates(defs_str)
+                meanings = [m.strip() for m in defs_str.split("/")]
+            if char not in pinyin_of:
+                pinyin_of[char] = pinyin
+                defs[char] = {}
+                readings[char] = {}
+            defs[char].update(dict.fromkeys(candidates))
+            group = readings[char].setdefault(pinyin, {})
+            group.update(dict.fromkeys(m for m in meanings if m))
+
+    index = {}
+    for char, pinyin in pinyin_of.items():
+        by_pinyin = {p: list(ms) for p, ms in readings[char].items()}
+        index[char] = {
+            "pinyin": pinyin,
+            "defs": list(defs[char]),
+            "reading": format_reading(by_pinyin),
+        }
+    return index
+
+
+def load_index(source_path, read_entries, cache_dir=CACHE_DIR):
+    """Return the index for source_path, using the on-disk cache when fresh.
+
+    read_entries() is only called on a cache miss and must yield
+    (trad, simp, pinyin, defs_str) tuples.
+    """
+    source_path = Path(source_path)
+    digest = file_sha256(source_path)
+    cache_path = Path(cache_dir) / f"{source_path.stem}.cedict.json"
+
+    if cache_path.exists():
+        try:
+            with open(cache_path, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+            if (cached.get("version") == INDEX_VERSION
+                    and cached.get("source_sha256") == digest):
+                return cached["index"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+    index = build_index(read_entries())
+    # Atomic: build.py stages run concurrently, and an interrupted write
+    # must not leave a truncated cache behind
+    write_text_if_changed(cache_path, json.dumps(
+        {"version": INDEX_VERSION, "source_sha256": digest, "index": index}, ensure_ascii=False))
+    return index
+
+
+def load_cedict(path=CEDICT_PATH, cache_dir=CACHE_DIR):
+    """Index for a cedict.txt file, or {} if it is missing."""
+    path = Path(path)
+    if not path.exists():
+        return {}
+    return load_index(path, lambda: read_cedict_txt(path), cache_dir)
@@ -10,18 +10,41 @@ Tier 3: No good approximation — placeholder; user provides PNGs manually.
 
 Output: data/primitive_images/<keyword_safe>.png
 Also writes data/primitive_images/manifest.json mapping keyword -> filename + metadata.
+
+All images are also packed into one sprite atlas (_heisig_primitives.png)
+with a coordinate map, atlas.json; see sprites.py.
+
+Each manifest entry records a render_hash of the image's inputs (character,
+font file and size, or the manual image's bytes). Images whose hash is
+unchanged are not re-rendered; the rest are rendered in a process pool.
+
+Usage:
+  python scripts/crop_primitives.py          # render new or changed images
+  python scripts/crop_primitives.py --force  # re-render everything
+  python scripts/crop_primitives.py --atlas-only  # just rebuild the atlas
 """
 
+import argparse
+import functools
+import hashlib
+import io
 import json
+import math
+import os
 import re
-import xml.etree.ElementTree as ET
+import shutil
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 from PIL import Image, ImageDraw, ImageFont
 
+from artifacts import file_sha256, status, write_bytes_if_changed, write_text_if_changed
+from rsh_xml import RSH_XML, load_rsh
+from sprites import ATLAS_FILE, CELL
+
 ROOT = Path(__file__).resolve().parent.parent
 OUTPUT_DIR = ROOT / "data" / "primitive_images"
-RSH_XML = ROOT / "data" / "heisig-repo" / "rsh.xml"
 
 # ── Approximation mapping ─────────────────────────────────────────────
 # (keyword, approx_char, tier, note)
@@ -100,42 +123,94 @@ def safe_filename(keyword):
 
 def get_non_unicode_primitives():
     """Get all 囧 primitives from XML: keyword -> character field."""
-    tree = ET.parse(RSH_XML)
-    root = tree.getroot()
-    prims = {}
-    for book in root.findall(".//book"):
-        for page in book.findall(".//page"):
-            for frame in page.findall("frame"):
-                char = frame.get("character", "")
-                if "囧" in char:
-                    kw = frame.get("keyword", "")
-                    prims[kw] = char
-    return prims
+    return load_rsh(RSH_XML)["jiong"]
+
+
+# Fonts are resolved once per process (see find_font)
+CJK_FONT_CANDIDATES = [
+    # macOS
+    "/System/Library/Fonts/STHeiti Light.ttc",
+    "/System/Library/Fonts/Hiragino Sans GB.ttc",
+    "/System/Library/Fonts/PingFang.ttc",
+    "/System/Library/Fonts/Supplemental/Songti.ttc",
+    "/Library/Fonts/Arial Unicode.ttf",
+    "/System/Library/Fonts/AppleSDGothicNeo.ttc",
+]
+LATIN_FONT_CANDIDATES = ["/System/Library/Fonts/Helvetica.ttc"]
+
+# fontconfig queries and file name patterns used on Linux
+FONTCONFIG_PATTERNS = {"cjk": ":lang=zh-cn", "latin": "sans-serif"}
+FONT_FILE_PATTERNS = {
+    "cjk": ["NotoSansCJK*", "NotoSerifCJK*", "SourceHanSans*", "wqy-*", "DroidSansFallback*", "uming*", "ukai*"],
+    "latin": ["DejaVuSans.ttf", "LiberationSans-Regular.ttf", "NotoSans-Regular.ttf"],
+}
+FONT_DIRS = ["/usr/share/fonts", "/usr/local/share/fonts", "~/.local/share/fonts", "~/.fonts"]
 
 
-def render_character(char, size=200, font_size=160):
-    """Render a single CJK character as a PNG image."""
-    img = Image.new("RGBA", (size, size), (255, 255, 255, 255))
-    draw = ImageDraw.Draw(img)
+def _fontconfig_match(pattern):
+    """Font file fontconfig picks for pattern, or None if fc-match is unavailable."""
+    if not shutil.which("fc-match"):
+        return None
+    try:
+        out = subprocess.run(["fc-match", "-f", "%{file}", pattern],
+                             capture_output=True, text=True, timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out or None
+
+
+@functools.lru_cache(maxsize=None)
+def find_font(kind="cjk"):
+    """Path of the font used for kind ("cjk" or "latin"), or None.
+
+    Order: $HEISIG_CJK_FONT / $HEISIG_LATIN_FONT, the macOS fonts this
+    script was written against, fontconfig, then a scan of the usual
+    Linux font directories.
+    """
+    env = os.environ.get(f"HEISIG_{kind.upper()}_FONT")
+    if env and Path(env).exists():
+        return env
+    for path in CJK_FONT_CANDIDATES if kind == "cjk" else LATIN_FONT_CANDIDATES:
+        if Path(path).exists():
+            return path
+    matched = _fontconfig_match(FONTCONFIG_PATTERNS[kind])
+    # fc-match always answers; for CJK make sure it didn't fall back to a Latin font
+    if matched and (kind != "cjk" or any(Path(matched).match(p) for p in FONT_FILE_PATTERNS[kind])):
+        return matched
+    for font_dir in FONT_DIRS:
+        font_dir = Path(font_dir).expanduser()
+        if not font_dir.is_dir():
+            continue
+        for pattern in FONT_FILE_PATTERNS[kind]:
+            found = sorted(font_dir.rglob(pattern))
+            if found:
+                return str(found[0])
+    return None
 
-    # Try several CJK fonts on macOS
-    font = None
-    for font_path in [
-        "/System/Library/Fonts/STHeiti Light.ttc",
-        "/System/Library/Fonts/Hiragino Sans GB.ttc",
-        "/System/Library/Fonts/PingFang.ttc",
-        "/System/Library/Fonts/Supplemental/Songti.ttc",
-        "/Library/Fonts/Arial Unicode.ttf",
-        "/System/Library/Fonts/AppleSDGothicNeo.ttc",
-    ]:
+
+@functools.lru_cache(maxsize=None)
+def load_font(kind, size):
+    path = find_font(kind)
+    if path:
         try:
-            font = ImageFont.truetype(font_path, font_size)
-            break
+            return ImageFont.truetype(path, size)
         except (IOError, OSError):
-            continue
+            pass
+    return ImageFont.load_default()
 
-    if font is None:
-        font = ImageFont.load_default()
+
+@functools.lru_cache(maxsize=None)
+def font_identity(kind):
+    """Identifies the font in render hashes: path and content hash."""
+    path = find_font(kind)
+    return f"{path}:{file_sha256(path)}" if path else "default"
+
+
+def render_character(char, size=200, font_size=160):
+    """Render a single CJK character as a PNG image."""
+    img = Image.new("RGBA", (size, size), (255, 255, 255, 255))
+    draw = ImageDraw.Draw(img)
+    font = load_font("cjk", font_size)
 
     # Center the character
     bbox = draw.textbbox((0, 0), char, font=font)
@@ -153,11 +228,7 @@ def render_placeholder(keyword, note):
     size = 200
     img = Image.new("RGBA", (size, size), (255, 255, 255, 255))
     draw = ImageDraw.Draw(img)
-
-    try:
-        font = ImageFont.truetype("/System/Library/Fonts/Helvetica.ttc", 16)
-    except (IOError, OSError):
-        font = ImageFont.load_default()
+    font = load_font("latin", 16)
 
     draw.text((10, 80), f"[{keyword}]", fill=(180, 0, 0, 255), font=font)
     draw.text((10, 110), "needs image", fill=(128, 128, 128, 255), font=font)
@@ -165,74 +236,152 @@ def render_placeholder(keyword, note):
     return img
 
 
+def png_bytes(img):
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+# Bump when rendering changes in a way the inputs below don't capture
+RENDER_VERSION = 1
+
+
+def render_job(keyword, manual_path):
+    """What to produce for one primitive: (kind, args, metadata) or None to skip."""
+    approx_char, tier, note = APPROXIMATIONS[keyword]
+    fname = safe_filename(keyword) + ".png"
+    if tier == 3:
+        if keyword == "Biang":
+            return None  # skip novelty character
+        if manual_path.exists():
+            return ("manual", (str(manual_path),),
+                    {"file": fname, "tier": 3, "source": "manual", "note": note, "approximate": False})
+        return ("placeholder", (keyword, note),
+                {"file": fname, "tier": 3, "source": "placeholder", "note": note, "approximate": False})
+    return ("character", (approx_char,),
+            {"file": fname, "tier": tier, "source": "exact" if tier == 1 else "approximate",
+             "approx_char": approx_char, "note": note, "approximate": tier == 2})
+
+
+def render_hash(kind, args):
+    """Hash of everything an image depends on: renderer, inputs, font and size."""
+    if kind == "manual":
+        source = file_sha256(args[0])
+    elif kind == "placeholder":
+        source = f"{args[0]}|{font_identity('latin')}|16"
+    else:
+        source = f"{args[0]}|{font_identity('cjk')}|200/160"
+    return hashlib.sha256(f"v{RENDER_VERSION}|{kind}|{source}".encode("utf-8")).hexdigest()
+
+
+def render_png(kind, args):
+    """Render one image in a worker; returns PNG bytes."""
+    if kind == "manual":
+        with Image.open(args[0]) as img:
+            return png_bytes(img)
+    if kind == "placeholder":
+        img = render_placeholder(*args)
+    else:
+        img = render_character(*args)
+    return png_bytes(img)
+
+
+def write_atlas(manifest, output_dir=OUTPUT_DIR):
+    """Pack the manifest's images into one sprite atlas plus atlas.json.
+
+    Images are scaled to CELL x CELL and laid out row by row, in manifest
+    order, on a near-square grid. Returns True if either file changed.
+    """
+    keywords = [kw for kw, entry in manifest.items() if (output_dir / entry["file"]).exists()]
+    columns = max(1, math.ceil(math.sqrt(len(keywords))))
+    rows = max(1, math.ceil(len(keywords) / columns))
+    atlas = Image.new("RGBA", (columns * CELL, rows * CELL), (255, 255, 255, 0))
+    sprites = {}
+    for i, keyword in enumerate(keywords):
+        column, row = i % columns, i // columns
+        with Image.open(output_dir / manifest[keyword]["file"]) as img:
+            cell = img.convert("RGBA").resize((CELL, CELL), Image.LANCZOS)
+        atlas.paste(cell, (column * CELL, row * CELL))
+        sprites[keyword] = {"column": column, "row": row}
+
+    coords = {"file": ATLAS_FILE, "cell": CELL, "columns": columns, "rows": rows, "sprites": sprites}
+    changed = write_bytes_if_changed(output_dir / ATLAS_FILE, png_bytes(atlas))
+    changed |= write_text_if_changed(output_dir / "atlas.json",
+                                     json.dumps(coords, ensure_ascii=False, indent=2))
+    return changed
+
+
 def main():
+    parser = argparse.ArgumentParser(description="Generate primitive images for non-unicode Heisig primitives.")
+    parser.add_argument("-j", "--jobs", type=int, help="render processes (default: one per CPU)")
+    parser.add_argument("--force", action="store_true", help="re-render even if the manifest hash matches")
+    parser.add_argument("--atlas-only", action="store_true",
+                        help="only rebuild the sprite atlas from the images already in the manifest")
+    args = parser.parse_args()
+
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    manifest_path = OUTPUT_DIR / "manifest.json"
+    old_manifest = {}
+    if manifest_path.exists():
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            old_manifest = json.load(f)
+
+    if args.atlas_only:
+        changed = write_atlas(old_manifest)
+        print(f"Atlas: {OUTPUT_DIR / ATLAS_FILE} ({status(changed)})")
+        return
 
     non_unicode = get_non_unicode_primitives()
     print(f"Total 囧 primitives in XML: {len(non_unicode)}")
+    print(f"CJK font: {find_font('cjk') or 'PIL default (no CJK font found)'}")
 
     manifest = {}
-    saved = 0
-    tier3_list = []
-
+    to_render = []  # (keyword, kind, args)
     for keyword, orig_char in sorted(non_unicode.items()):
         if keyword not in APPROXIMATIONS:
             print(f"  WARNING: no approximation defined for '{keyword}'")
             continue
-
-        approx_char, tier, note = APPROXIMATIONS[keyword]
         fname = safe_filename(keyword) + ".png"
-        out_path = OUTPUT_DIR / fname
-
-        if tier == 3:
-            if keyword == "Biang":
-                continue  # skip novelty character
-
-            # Check if user has provided a manual image
-            manual = OUTPUT_DIR / "manual" / fname
-            if manual.exists():
-                # Copy manual image
-                img = Image.open(manual)
-                img.save(out_path)
-                manifest[keyword] = {
-                    "file": fname, "tier": 3, "source": "manual",
-                    "note": note, "approximate": False,
-                }
-                saved += 1
-                print(f"  {keyword}: using manual image")
-            else:
-                # Render placeholder
-                img = render_placeholder(keyword, note)
-                img.save(out_path)
-                manifest[keyword] = {
-                    "file": fname, "tier": 3, "source": "placeholder",
-                    "note": note, "approximate": False,
-                }
-                tier3_list.append((keyword, note))
-                saved += 1
-                print(f"  {keyword}: PLACEHOLDER (needs manual image)")
+        job = render_job(keyword, OUTPUT_DIR / "manual" / fname)
+        if job is None:
+            continue
+        kind, job_args, entry = job
+        entry["render_hash"] = render_hash(kind, job_args)
+        manifest[keyword] = entry
+
+        old = old_manifest.get(keyword, {})
+        if (not args.force and old.get("render_hash") == entry["render_hash"]
+                and (OUTPUT_DIR / fname).exists()):
+            continue
+        to_render.append((keyword, kind, job_args))
+
+    # Render what changed across a process pool; files are written here
+    workers = min(len(to_render), args.jobs or os.cpu_count() or 1)
+    if workers > 1:
+        with ProcessPoolExecutor(workers) as pool:
+            pngs = list(pool.map(render_png, *zip(*((k, a) for _, k, a in to_render))))
+    else:
+        pngs = [render_png(kind, job_args) for _, kind, job_args in to_render]
+
+    for (keyword, kind, job_args), png in zip(to_render, pngs):
+        entry = manifest[keyword]
+        write_bytes_if_changed(OUTPUT_DIR / entry["file"], png)
+        if kind == "manual":
+            label = "using manual image"
+        elif kind == "placeholder":
+            label = "PLACEHOLDER (needs manual image)"
         else:
-            # Tier 1 or 2: render the approximation character
-            img = render_character(approx_char)
-            img.save(out_path)
-            manifest[keyword] = {
-                "file": fname, "tier": tier,
-                "source": "exact" if tier == 1 else "approximate",
-                "approx_char": approx_char,
-                "note": note,
-                "approximate": tier == 2,
-            }
-            saved += 1
-            label = "exact" if tier == 1 else f"≈ {approx_char}"
-            print(f"  {keyword}: {label}")
-
-    # Write manifest
-    manifest_path = OUTPUT_DIR / "manifest.json"
-    with open(manifest_path, "w", encoding="utf-8") as f:
-        json.dump(manifest, f, ensure_ascii=False, indent=2)
+            label = "exact" if entry["tier"] == 1 else f"≈ {entry['approx_char']}"
+        print(f"  {keyword}: {label}")
+    tier3_list = [(kw, e["note"]) for kw, e in manifest.items() if e["source"] == "placeholder"]
+
+    # Write manifest and the sprite atlas built from it
+    write_text_if_changed(manifest_path, json.dumps(manifest, ensure_ascii=False, indent=2))
+    atlas_changed = write_atlas(manifest)
 
     print(f"\n{'='*50}")
-    print(f"Saved: {saved} images")
+    print(f"Images: {len(manifest)} ({len(to_render)} rendered, "
+          f"{len(manifest) - len(to_render)} up to date)")
     print(f"  Tier 1 (exact): {sum(1 for v in manifest.values() if v['tier'] == 1)}")
     print(f"  Tier 2 (approx): {sum(1 for v in manifest.values() if v['tier'] == 2)}")
     print(f"  Tier 3 (manual/placeholder): {sum(1 for v in manifest.values() if v['tier'] == 3)}")
@@ -244,6 +393,7 @@ def main():
             print(f"    {safe_filename(kw)}.png  — {kw} ({note})")
 
     print(f"\nManifest: {manifest_path}")
+    print(f"Atlas: {OUTPUT_DIR / ATLAS_FILE} ({status(atlas_changed)})")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""Explain every unique CJK character in a text corpus, for reading-prep decks.
+
+Text is streamed from files (or stdin) in CHUNK_CHARS pieces, so memory
+stays constant however large the corpus is: the only state kept is a
+count per distinct character. The unique CJK characters are then looked
+up with heisig_addon/decompose.py across a process pool and written, most
+frequent first, as:
+
+  csv   header row + one note per character; import into Anki with
+        "Allow HTML in fields" (the explanation is HTML)
+  json  array of objects
+  html  table for review or printing
+
+Characters not in the Heisig data are skipped (and counted) unless
+--keep-unknown is given. Throughput is reported on stderr.
+
+Usage:
+  python scripts/explain_corpus.py novel.txt -o novel_prep.csv
+  cat *.txt | python scripts/explain_corpus.py - --format json -o prep.json
+  python scripts/explain_corpus.py book.txt --min-count 3 --format html > prep.html
+"""
+
+import argparse
+import csv
+import html
+import io
+import json
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from pathlib import Path
+
+from artifacts import AtomicOutput, status
+
+ROOT = Path(__file__).resolve().parent.parent
+# decompose.py has no Anki dependency; import it without the add-on package,
+# whose __init__ needs aqt
+sys.path.insert(0, str(ROOT / "heisig_addon"))
+import decompose  # noqa: E402
+
+CHUNK_CHARS = 1 << 20
+FIELDS = ["character", "keyword", "reading", "decomposition", "explanation", "count"]
+
+# CJK Unified Ideographs (with extensions) and compatibility ideographs
+CJK_RANGES = [
+    (0x3400, 0x4DBF), (0x4E00, 0x9FFF), (0xF900, 0xFAFF),
+    (0x20000, 0x2A6DF), (0x2A700, 0x2EBEF), (0x2F800, 0x2FA1F), (0x30000, 0x323AF),
+]
+
+
+def is_cjk(char):
+    cp = ord(char)
+    return any(lo <= cp <= hi for lo, hi in CJK_RANGES)
+
+
+def count_characters(streams, on_chunk=None):
+    """Count every character in the text streams, one chunk at a time.
+
+    Returns (Counter of CJK characters, characters read). on_chunk, if
+    given, is called with the running character total after each chunk.
+    """
+    counts = Counter()
+    total = 0
+    for stream in streams:
+        for chunk in iter(lambda: stream.read(CHUNK_CHARS), ""):
+            # Counter.update on a str counts in C; non-CJK keys are
+            # dropped once at the end
+            counts.update(chunk)
+            total += len(chunk)
+            if on_chunk:
+                on_chunk(total)
+    return Counter({c: n for c, n in counts.items() if is_cjk(c)}), total
+
+
+def explain_row(char):
+    """Output fields for char, or None if it isn't in the Heisig data."""
+    info = decompose.lookup(char)
+    if info is None:
+        return None
+    return {
+        "character": char,
+        "keyword": info.get("keyword", ""),
+        "reading": info.get("reading", ""),
+        "decomposition": info.get("decomposition", ""),
+        "explanation": decompose.format_explanation(char, info),
+    }
+
+
+def _init_worker():
+    # Load the data once per process, not per character
+    decompose._load()
+    decompose._load_variants()
+
+
+def explain_all(chars, jobs=None):
+    """Yield explain_row() for each char, in order, across a process pool."""
+    workers = jobs or os.cpu_count() or 1
+    if workers <= 1 or len(chars) < 1000:
+        yield from map(explain_row, chars)
+        return
+    with ProcessPoolExecutor(workers, initializer=_init_worker) as pool:
+        yield from pool.map(explain_row, chars, chunksize=256)
+
+
+class _CSVWriter:
+    def __init__(self, f):
+        self._writer = csv.DictWriter(f, fieldnames=FIELDS)
+        self._writer.writeheader()
+
+    def write(self, row):
+        self._writer.writerow(row)
+
+    def close(self):
+        pass
+
+
+class _JSONWriter:
+    def __init__(self, f):
+        self._f = f
+        self._first = True
+        f.write("[")
+
+    def write(self, row):
+        self._f.write(("\n" if self._first else ",\n") + json.dumps(row, ensure_ascii=False))
+        self._first = False
+
+    def close(self):
+        self._f.write("\n]\n")
+
+
+class _HTMLWriter:
+    def __init__(self, f):
+        self._f = f
+        f.write('<!DOCTYPE html>\n<html lang="zh">\n<head>\n<meta charset="UTF-8">\n'
+                "<title>Heisig reading prep</title>\n<style>\n"
+                "body { font-family: sans-serif; }\n"
+                "td { border-bottom: 1px solid #eee; padding: 6px 10px; vertical-align: top; }\n"
+                "td.character { font-size: 2em; }\n"
+                "</style>\n</head>\n<body>\n<table>\n<tr>"
+                + "".join(f"<th>{name}</th>" for name in FIELDS) + "</tr>\n")
+
+    def write(self, row):
+        cells = []
+        for name in FIELDS:
+            value = str(row[name])
+            # The explanation is already HTML
+            cells.append(f'<td class="{name}">{value if name == "explanation" else html.escape(value)}</td>')
+        self._f.write("<tr>" + "".join(cells) + "</tr>\n")
+
+    def close(self):
+        self._f.write("</table>\n</body>\n</html>\n")
+
+
+WRITERS = {"csv": _CSVWriter, "json": _JSONWriter, "html": _HTMLWriter}
+
+
+def open_inputs(paths):
+    """Text streams for the given paths ("-" is stdin); undecodable bytes are replaced."""
+    for path in paths or ["-"]:
+        if path == "-":
+            yield io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8", errors="replace")
+        else:
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                yield f
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("inputs", nargs="*", help="text files (default or '-': stdin)")
+    parser.add_argument("-o", "--output", help="output file (default: stdout)")
+    parser.add_argument("--format", choices=sorted(WRITERS),
+                        help="output format (default: from --output's extension, else csv)")
+    parser.add_argument("--min-count", type=int, default=1,
+                        help="only characters seen at least this many times")
+    parser.add_argument("--keep-unknown", action="store_true",
+                        help="also output characters that aren't in the Heisig data")
+    parser.add_argument("-j", "--jobs", type=int, help="lookup processes (default: one per CPU)")
+    args = parser.parse_args()
+
+    fmt = args.format
+    if fmt is None:
+        suffix = Path(args.output).suffix.lstrip(".").lower() if args.output else ""
+        fmt = suffix if suffix in WRITERS else "csv"
+
+    def log(msg):
+        print(msg, file=sys.stderr)
+
+    start = time.perf_counter()
+    counts, total = count_characters(open_inputs(args.inputs))
+    scan_s = time.perf_counter() - start
+    log(f"Read {total:,} characters in {scan_s:.2f}s "
+        f"({total / max(scan_s, 1e-9) / 1e6:.1f}M chars/s): {len(counts):,} unique CJK characters")
+
+    chars = [c for c, n in counts.most_common() if n >= args.min_count]
+    out = (AtomicOutput(args.output, "w", encoding="utf-8", newline="") if args.output
+           else nullcontext(sys.stdout))
+    start = time.perf_counter()
+    written = unknown = 0
+    try:
+        with out as f:
+            writer = WRITERS[fmt](f)
+            for char, row in zip(chars, explain_all(chars, args.jobs)):
+                if row is None:
+                    unknown += 1
+                    if not args.keep_unknown:
+                        continue
+                    row = {name: "" for name in FIELDS}
+                    row["character"] = char
+                row["count"] = counts[char]
+                writer.write(row)
+                written += 1
+            writer.close()
+            f.flush()
+    except BrokenPipeError:
+        # The reader went away (e.g. `| head`): stop quietly. Point stdout at
+        # devnull so the flush at interpreter exit doesn't raise again.
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(1)
+    explain_s = time.perf_counter() - start
+
+    log(f"Explained {len(chars):,} characters in {explain_s:.2f}s "
+        f"({len(chars) / max(explain_s, 1e-9):,.0f}/s); {written:,} written as {fmt}, "
+        f"{unknown:,} not in the Heisig data{' (kept)' if args.keep_unknown else ''}")
+    if args.output:
+        log(f"  -> {args.output} ({status(out.changed)})")
+
+
+if __name__ == "__main__":
+    main()
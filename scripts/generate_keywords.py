@@ -6,85 +6,41 @@ Strategy:
 2. Skip definitions that are just variants/references
 3. Fall back to Unihan if no CC-CEDICT entry
 4. Only use numbered suffixes as last resort
+
+Assignments are kept in data/keyword_assignments.json, so a re-run only
+assigns characters that are new and never changes an existing keyword.
+To change one, add it to data/keyword_overrides.json ({char: keyword}).
 """
 
 import json
+import os
 import re
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+from artifacts import write_text_if_changed
+from build_addon_data import ADDON_OUT, load_addon_data
+from cedict_index import load_cedict
+from unihan_index import load_field
+
 ROOT = Path(__file__).resolve().parent.parent
 CEDICT_PATH = ROOT / "data" / "cedict.txt"
-UNIHAN_PATH = ROOT / "data" / "Unihan_Readings.txt"
+ASSIGNMENTS_PATH = ROOT / "data" / "keyword_assignments.json"
+OVERRIDES_PATH = ROOT / "data" / "keyword_overrides.json"
 
 
 def parse_cedict():
-    """Parse CC-CEDICT into char -> list of definitions."""
-    cedict = {}
-    if not CEDICT_PATH.exists():
-        return cedict
-
-    with open(CEDICT_PATH, "r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line or line.startswith("#"):
-                continue
-            # Format: 傳統 简体 [pinyin] /def1/def2/
-            match = re.match(r"(\S+)\s+(\S+)\s+\[([^\]]+)\]\s+/(.+)/", line)
-            if not match:
-                continue
-            trad, simp, pinyin, defs_str = match.groups()
-
-            # Split definitions and clean them
-            defs = []
-            for d in defs_str.split("/"):
-                d = d.strip()
-                if not d:
-                    continue
-                # Skip pure variant references
-                if re.match(r"^(variant of|see |also written|abbr\. for|same as)", d, re.I):
-                    continue
-                # Clean up parenthetical notes at start but keep the main def
-                d = re.sub(r"^\([^)]+\)\s*", "", d)
-                if not d:
-                    continue
-                # Also split on semicolons (e.g., "to gnaw; to bite")
-                for sub in d.split(";"):
-                    sub = sub.strip()
-                    if sub:
-                        defs.append(sub)
-
-            # Store for both trad and simp
-            for char in [trad, simp]:
-                if len(char) == 1:  # Single character only
-                    if char not in cedict:
-                        cedict[char] = {"pinyin": pinyin, "defs": []}
-                    # Add new definitions we haven't seen
-                    for d in defs:
-                        if d not in cedict[char]["defs"]:
-                            cedict[char]["defs"].append(d)
-
-    return cedict
+    """Parse CC-CEDICT into char -> {"pinyin", "defs"} (cached index)."""
+    return load_cedict(CEDICT_PATH)
 
 
 def parse_unihan():
-    """Parse Unihan_Readings.txt for kDefinition."""
+    """Unihan kDefinition split into keyword candidates (from the Unihan index)."""
     unihan = {}
-    if not UNIHAN_PATH.exists():
-        return unihan
-
-    with open(UNIHAN_PATH, "r", encoding="utf-8") as f:
-        for line in f:
-            if "\tkDefinition\t" in line:
-                parts = line.strip().split("\t")
-                if len(parts) >= 3:
-                    codepoint = parts[0]  # U+XXXX
-                    definition = parts[2]
-                    # Convert codepoint to character
-                    char = chr(int(codepoint[2:], 16))
-                    # Split definitions by semicolon or comma
-                    defs = [d.strip() for d in re.split(r"[;,]", definition) if d.strip()]
-                    unihan[char] = defs
-
+    for char, definition in load_field("kDefinition").items():
+        # Split definitions by semicolon or comma
+        defs = [d.strip() for d in re.split(r"[;,]", definition) if d.strip()]
+        unihan[char] = defs
     return unihan
 
 
@@ -101,6 +57,151 @@ def normalize_keyword(kw):
     return kw
 
 
+def char_candidates(char, cedict, unihan, norm_cache=None):
+    """Keyword candidates for one character, independent of any other.
+
+    Returns (reading, cedict_defs, unihan_defs, base_def, in_cedict), where
+    cedict_defs and unihan_defs are lists of (keyword, normalized) pairs and
+    base_def is the definition used for a numbered fallback (or None).
+    """
+    if norm_cache is None:
+        norm_cache = {}
+
+    def pairs(defs):
+        result = []
+        for d in defs:
+            norm = norm_cache.get(d)
+            if norm is None:
+                norm = norm_cache[d] = normalize_keyword(d)
+            result.append((d, norm))
+        return result
+
+    cedict_entry = cedict.get(char)
+    unihan_defs = unihan.get(char) or []
+    cedict_defs = cedict_entry["defs"] if cedict_entry else []
+
+    if cedict_defs:
+        base_def = cedict_defs[0]
+    elif unihan_defs:
+        base_def = unihan_defs[0]
+    else:
+        base_def = None
+
+    reading = cedict_entry["pinyin"] if cedict_entry else ""
+    return reading, pairs(cedict_defs), pairs(unihan_defs), base_def, cedict_entry is not None
+
+
+class KeywordAssigner:
+    """Assign unique keywords in one pass against a shared used-keyword set.
+
+    Tries CC-CEDICT definitions, then Unihan, then "<first def> (N)".
+    Normalized forms are cached, and the numbered fallback keeps a
+    next-suffix counter per normalized base, so each suffix is probed at
+    most once per base rather than re-scanning from (2) every time.
+
+    claim() takes precomputed char_candidates(), so candidates can be built
+    in parallel while claiming stays sequential and order-dependent.
+    """
+
+    MAX_SUFFIX = 100  # suffixes run (2) .. (99)
+
+    def __init__(self, cedict, unihan, used_keywords, numbered_source=None):
+        self.cedict = cedict
+        self.unihan = unihan
+        self.used = set(used_keywords)
+        self.numbered_source = numbered_source
+        self._norm = {}
+        self._next_suffix = {}  # normalized base -> next suffix to try
+
+    def _claim_first(self, pairs):
+        for d, norm in pairs:
+            if norm not in self.used:
+                self.used.add(norm)
+                return d
+        return None
+
+    def _claim_numbered(self, base_def):
+        # normalize_keyword() lowercases, strips and folds plural endings;
+        # "... (N)" ends in ")", which no plural rule matches, so the
+        # normalized candidate is just the lowercased base + suffix
+        base = base_def.lower().lstrip()
+        i = self._next_suffix.get(base, 2)
+        while i < self.MAX_SUFFIX and f"{base} ({i})" in self.used:
+            i += 1
+        self._next_suffix[base] = i
+        if i >= self.MAX_SUFFIX:
+            return None
+        self.used.add(f"{base} ({i})")
+        self._next_suffix[base] = i + 1
+        return f"{base_def} ({i})"
+
+    def claim(self, candidates):
+        """Return (keyword, reading, source) for char_candidates() output, or None."""
+        reading, cedict_defs, unihan_defs, base_def, in_cedict = candidates
+
+        keyword = self._claim_first(cedict_defs)
+        if keyword is not None:
+            return keyword, reading, "cedict"
+
+        keyword = self._claim_first(unihan_defs)
+        if keyword is not None:
+            return keyword, reading, "unihan"
+
+        # Last resort: numbered suffix using first definition
+        if not base_def:
+            return None
+        keyword = self._claim_numbered(base_def)
+        if keyword is None:
+            return None
+        source = self.numbered_source or ("cedict+num" if in_cedict else "unihan+num")
+        return keyword, reading, source
+
+    def assign(self, char):
+        """Return (keyword, reading, source) for char, or None if no keyword."""
+        return self.claim(char_candidates(char, self.cedict, self.unihan, self._norm))
+
+
+# Per-process state for build_candidates() workers
+_worker = {}
+
+
+def _init_candidate_worker(cedict, unihan, heisig_data):
+    _worker.update(cedict=cedict, unihan=unihan, heisig_data=heisig_data, norm={})
+
+
+def _candidate_job(item):
+    char, ids = item
+    w = _worker
+    return (char_candidates(char, w["cedict"], w["unihan"], w["norm"]),
+            get_component_detail(char, ids, w["heisig_data"]))
+
+
+def build_candidates(entries, cedict, unihan, heisig_data, jobs=None):
+    """Phase one: char -> (candidates, components_detail) for every entry.
+
+    Runs across a process pool; each worker only receives the CEDICT,
+    Unihan and Heisig keyword entries it can need.
+    """
+    items = list({e["char"]: e["ids"] for e in entries}.items())
+    chars = {char for char, _ in items}
+    cedict = {c: cedict[c] for c in chars if c in cedict}
+    unihan = {c: unihan[c] for c in chars if c in unihan}
+    # get_component_detail() only reads the keyword of each component
+    heisig_data = {c: {"keyword": info.get("keyword", "")} for c, info in heisig_data.items()}
+
+    jobs = jobs or os.cpu_count() or 1
+    if jobs <= 1 or len(items) < 1000:
+        _init_candidate_worker(cedict, unihan, heisig_data)
+        results = map(_candidate_job, items)
+    else:
+        chunksize = max(1, len(items) // (jobs * 4))
+        pool = ProcessPoolExecutor(jobs, initializer=_init_candidate_worker,
+                                   initargs=(cedict, unihan, heisig_data))
+        with pool:
+            results = list(pool.map(_candidate_job, items, chunksize=chunksize))
+    return {char: result for (char, _), result in zip(items, results)}
+
+
 def generate_keywords(chars_to_process, existing_keywords):
     """
     Generate unique keywords for a list of characters.
@@ -112,83 +213,30 @@ def generate_keywords(chars_to_process, existing_keywords):
     Returns:
         list of dicts with 'keyword', 'reading', 'source' added
     """
-    cedict = parse_cedict()
-    unihan = parse_unihan()
-
-    used_keywords = set(existing_keywords)
+    assigner = KeywordAssigner(parse_cedict(), parse_unihan(), existing_keywords)
     results = []
     failed = []
 
     for entry in chars_to_process:
-        char = entry["char"]
-        keyword = None
-        reading = ""
-        source = None
-
-        # Try CC-CEDICT definitions
-        if char in cedict:
-            reading = cedict[char]["pinyin"]
-            for d in cedict[char]["defs"]:
-                norm = normalize_keyword(d)
-                if norm not in used_keywords:
-                    keyword = d
-                    source = "cedict"
-                    used_keywords.add(norm)
-                    break
-
-        # Try Unihan definitions
-        if keyword is None and char in unihan:
-            for d in unihan[char]:
-                norm = normalize_keyword(d)
-                if norm not in used_keywords:
-                    keyword = d
-                    source = "unihan"
-                    used_keywords.add(norm)
-                    break
-
-        # Last resort: numbered suffix using first definition
-        if keyword is None:
-            base_def = None
-            if char in cedict and cedict[char]["defs"]:
-                base_def = cedict[char]["defs"][0]
-                reading = cedict[char]["pinyin"]
-            elif char in unihan and unihan[char]:
-                base_def = unihan[char][0]
-
-            if base_def:
-                # Find next available number
-                for i in range(2, 100):
-                    candidate = f"{base_def} ({i})"
-                    norm = normalize_keyword(candidate)
-                    if norm not in used_keywords:
-                        keyword = candidate
-                        source = "cedict+num" if char in cedict else "unihan+num"
-                        used_keywords.add(norm)
-                        break
-
-        if keyword:
-            entry["keyword"] = keyword
-            entry["reading"] = reading
-            entry["source"] = source
+        assigned = assigner.assign(entry["char"])
+        if assigned:
+            entry["keyword"], entry["reading"], entry["source"] = assigned
             results.append(entry)
         else:
-            failed.append(char)
+            failed.append(entry["char"])
 
     return results, failed
 
 
 def load_existing_keywords():
-    """Load keywords already in use from heisig_data.json."""
-    data_path = ROOT / "heisig_addon" / "data" / "heisig_data.json"
+    """Load keywords already in use from the add-on data."""
     keywords = set()
 
-    if data_path.exists():
-        with open(data_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            for char, info in data.items():
-                kw = info.get("keyword", "")
-                if kw:
-                    keywords.add(normalize_keyword(kw))
+    if os.path.exists(ADDON_OUT):
+        for char, info in load_addon_data().items():
+            kw = info.get("keyword", "")
+            if kw:
+                keywords.add(normalize_keyword(kw))
 
     return keywords
 
@@ -229,15 +277,49 @@ def get_component_detail(char, ids, heisig_data):
     return ", ".join(components)
 
 
-def regenerate_all():
-    """Regenerate all simplified and traditional character data with improved keywords."""
+def load_assignments(path=ASSIGNMENTS_PATH):
+    """Load the keyword store: char -> {"keyword", "source", "reading"}.
+
+    The first time, the store is seeded from the committed
+    generated_*.json, so keywords learners already have are kept.
+    """
+    path = Path(path)
+    if path.exists():
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    store = {}
+    for name in ("generated_simplified.json", "generated_traditional.json"):
+        generated = ROOT / "data" / name
+        if generated.exists():
+            with open(generated, "r", encoding="utf-8") as f:
+                for e in json.load(f):
+                    store.setdefault(e["char"], {"keyword": e["keyword"], "source": e["source"],
+                                                 "reading": e.get("reading", "")})
+    return store
+
+
+def load_overrides(path=OVERRIDES_PATH):
+    """Load explicit keyword overrides: char -> keyword."""
+    path = Path(path)
+    if not path.exists():
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def regenerate_all(jobs=None, reassign=False):
+    """Regenerate all simplified and traditional character data with improved keywords.
+
+    Characters already in the assignment store keep their keyword; only new
+    characters are assigned, and the store is extended with them.
+    Overrides replace stored keywords. With reassign=True the store is
+    ignored and every character is assigned from scratch.
+    """
     import csv
     import openpyxl
 
     # Load existing Heisig data
-    heisig_path = ROOT / "heisig_addon" / "data" / "heisig_data.json"
-    with open(heisig_path, "r", encoding="utf-8") as f:
-        heisig_data = json.load(f)
+    heisig_data = load_addon_data()
 
     # Collect existing keywords (from Heisig books only, not auto-generated)
     existing_keywords = set()
@@ -330,125 +412,59 @@ def regenerate_all():
     print(f"Simplified chars to process: {len(simplified_chars)}")
     print(f"Traditional chars to process: {len(traditional_chars)}")
 
-    # Generate keywords for simplified
-    used_keywords = set(existing_keywords)
-    simplified_results = []
-    simplified_failed = []
-
-    for entry in simplified_chars:
-        char = entry["char"]
-        keyword = None
-        reading = ""
-        source = None
-
-        # Try CC-CEDICT definitions
-        if char in cedict:
-            reading = cedict[char]["pinyin"]
-            for d in cedict[char]["defs"]:
-                norm = normalize_keyword(d)
-                if norm not in used_keywords:
-                    keyword = d
-                    source = "cedict"
-                    used_keywords.add(norm)
-                    break
-
-        # Try Unihan
-        if keyword is None and char in unihan:
-            for d in unihan[char]:
-                norm = normalize_keyword(d)
-                if norm not in used_keywords:
-                    keyword = d
-                    source = "unihan"
-                    used_keywords.add(norm)
-                    break
-
-        # Last resort: numbered suffix
-        if keyword is None:
-            base_def = None
-            if char in cedict and cedict[char]["defs"]:
-                base_def = cedict[char]["defs"][0]
-                reading = cedict[char]["pinyin"]
-            elif char in unihan and unihan[char]:
-                base_def = unihan[char][0]
-
-            if base_def:
-                for i in range(2, 100):
-                    candidate = f"{base_def} ({i})"
-                    norm = normalize_keyword(candidate)
-                    if norm not in used_keywords:
-                        keyword = candidate
-                        source = "numbered"
-                        used_keywords.add(norm)
-                        break
-
-        if keyword:
-            entry["keyword"] = keyword
-            entry["reading"] = reading
-            entry["source"] = source
-            entry["components_detail"] = get_component_detail(char, entry["ids"], heisig_data)
-            simplified_results.append(entry)
-        else:
-            simplified_failed.append(char)
-
-    # Generate keywords for Traditional (that aren't already in simplified)
-    simplified_char_set = {e["char"] for e in simplified_results}
-    traditional_results = []
-    traditional_failed = []
-
-    for entry in traditional_chars:
-        char = entry["char"]
-        if char in simplified_char_set:
-            continue
-
-        keyword = None
-        reading = ""
-        source = None
-
-        if char in cedict:
-            reading = cedict[char]["pinyin"]
-            for d in cedict[char]["defs"]:
-                norm = normalize_keyword(d)
-                if norm not in used_keywords:
-                    keyword = d
-                    source = "cedict"
-                    used_keywords.add(norm)
-                    break
-
-        if keyword is None and char in unihan:
-            for d in unihan[char]:
-                norm = normalize_keyword(d)
-                if norm not in used_keywords:
-                    keyword = d
-                    source = "unihan"
-                    used_keywords.add(norm)
-                    break
-
-        if keyword is None:
-            base_def = None
-            if char in cedict and cedict[char]["defs"]:
-                base_def = cedict[char]["defs"][0]
-                reading = cedict[char]["pinyin"]
-            elif char in unihan and unihan[char]:
-                base_def = unihan[char][0]
-
-            if base_def:
-                for i in range(2, 100):
-                    candidate = f"{base_def} ({i})"
-                    norm = normalize_keyword(candidate)
-                    if norm not in used_keywords:
-                        keyword = candidate
-                        source = "numbered"
-                        used_keywords.add(norm)
-                        break
-
-        if keyword:
-            entry["keyword"] = keyword
-            entry["reading"] = reading
-            entry["source"] = source
-            entry["components_detail"] = get_component_detail(char, entry["ids"], heisig_data)
-            traditional_results.append(entry)
-        else:
-            traditional_failed.append(char)
+    # Stored assignments are kept as-is; overrides replace them explicitly
+    store = {} if reassign else load_assignments()
+    for char, keyword in load_overrides().items():
+        old = store.get(char, {})
+        reading = old.get("reading") or (cedict[char]["pinyin"] if char in cedict else "")
+        store[char] = {"keyword": keyword, "source": "override", "reading": reading}
+
+    # Stored keywords stay reserved even for characters not in this run
+    stored_keywords = {normalize_keyword(a["keyword"]) for a in store.values()}
+    clashes = sorted(c for c, a in store.items()
+                     if normalize_keyword(a["keyword"]) in existing_keywords)
+    if clashes:
+        print(f"Warning: {len(clashes)} stored keywords clash with Heisig keywords "
+              f"(add overrides to change them): {''.join(clashes[:20])}")
+    existing_keywords |= stored_keywords
+
+    new_entries = [e for e in simplified_chars + traditional_chars if e["char"] not in store]
+    print(f"Stored assignments: {len(store)}, new characters: {len({e['char'] for e in new_entries})}")
+
+    # Phase one: candidates and component details for new chars, in parallel
+    candidates = build_candidates(new_entries, cedict, unihan, heisig_data, jobs)
+
+    # Phase two: claim keywords sequentially, simplified then traditional;
+    # traditional chars already assigned as simplified are skipped
+    assigner = KeywordAssigner(cedict, unihan, existing_keywords, numbered_source="numbered")
+    simplified_results, simplified_failed = [], []
+    traditional_results, traditional_failed = [], []
+    simplified_char_set = set()
+
+    batches = [(simplified_chars, simplified_results, simplified_failed, False),
+               (traditional_chars, traditional_results, traditional_failed, True)]
+    for entries, results, failed, is_traditional in batches:
+        for entry in entries:
+            char = entry["char"]
+            if is_traditional and char in simplified_char_set:
+                continue
+            if char in store:
+                stored = store[char]
+                assigned = stored["keyword"], stored["reading"], stored["source"]
+                components_detail = get_component_detail(char, entry["ids"], heisig_data)
+            else:
+                char_cands, components_detail = candidates[char]
+                assigned = assigner.claim(char_cands)
+                if not assigned:
+                    failed.append(char)
+                    continue
+                keyword, reading, source = assigned
+                store[char] = {"keyword": keyword, "source": source, "reading": reading}
+            entry["keyword"], entry["reading"], entry["source"] = assigned
+            entry["components_detail"] = components_detail
+            results.append(entry)
+            if not is_traditional:
+                simplified_char_set.add(char)
 
     # Count numbered keywords
     numbered_count = sum(1 for e in simplified_results + traditional_results if e.get("source") == "numbered")
@@ -459,13 +475,14 @@ def regenerate_all():
     print(f"  Keywords with numbers: {numbered_count}")
 
     # Save results
-    with open(ROOT / "data" / "generated_simplified.json", "w", encoding="utf-8") as f:
-        json.dump(simplified_results, f, ensure_ascii=False, indent=2)
-
-    with open(ROOT / "data" / "generated_traditional.json", "w", encoding="utf-8") as f:
-        json.dump(traditional_results, f, ensure_ascii=False, indent=2)
+    write_text_if_changed(ROOT / "data" / "generated_simplified.json",
+                          json.dumps(simplified_results, ensure_ascii=False, indent=2))
+    write_text_if_changed(ROOT / "data" / "generated_traditional.json",
+                          json.dumps(traditional_results, ensure_ascii=False, indent=2))
+    write_text_if_changed(ASSIGNMENTS_PATH, json.dumps(store, ensure_ascii=False, indent=2))
 
     print(f"\nSaved to data/generated_simplified.json and data/generated_traditional.json")
+    print(f"Saved: data/keyword_assignments.json ({len(store)} assignments)")
 
     # Show some examples of numbered keywords
     print(f"\nExamples of numbered keywords:")
@@ -475,9 +492,15 @@ def regenerate_all():
 
 
 if __name__ == "__main__":
-    import sys
-    if len(sys.argv) > 1 and sys.argv[1] == "--regenerate":
-        regenerate_all()
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--regenerate", action="store_true", help="regenerate all data")
+    parser.add_argument("-j", "--jobs", type=int, help="worker processes for candidate generation")
+    parser.add_argument("--reassign", action="store_true",
+                        help="ignore data/keyword_assignments.json and assign every keyword afresh")
+    args = parser.parse_args()
+    if args.regenerate:
+        regenerate_all(args.jobs, args.reassign)
     else:
         # Test with the "gnaw" characters
         cedict = parse_cedict()
@@ -485,4 +508,4 @@ if __name__ == "__main__":
         for char in ["啃", "嘬", "龁", "囓", "齕"]:
             if char in cedict:
                 print(f"  {char}: {cedict[char]['defs']}")
-        print("\nRun with --regenerate to regenerate all data")
+        print("\nRun with --regenerate [-j N] to regenerate all data")
@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""Local HTTP lookup service over heisig_addon/decompose.py.
+
+Standard library only (asyncio streams, HTTP/1.1 with keep-alive), so
+tools that need decompositions can share one loader instead of each
+re-implementing it.
+
+  GET  /lookup?char=学          decomposition entry (404 if unknown)
+  GET  /explain?char=学         {"char", "html"}: format_explanation()
+  POST /lookup   {"chars": ["学", "森"]}  or  {"chars": "学森"}
+  POST /explain  same body; {"results": {char: entry or null}}
+  GET  /stats                   request count and response cache hits
+
+Rendered responses are kept in an LRU cache keyed by method, path and a
+hash of the body. The data is read-only while the server runs.
+Malformed requests get a 400 and unexpected errors a 500, both with a
+JSON {"error"} body.
+
+Usage:
+  python scripts/lookup_server.py                  # serve on 127.0.0.1:8765
+  python scripts/lookup_server.py --port 9000 --cache-size 0
+  python scripts/lookup_server.py --load-test      # req/s and latency percentiles
+  python scripts/lookup_server.py --load-test --target 127.0.0.1:9000
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import sys
+import time
+from collections import OrderedDict
+from pathlib import Path
+from urllib.parse import parse_qs, quote, urlsplit
+
+ROOT = Path(__file__).resolve().parent.parent
+# decompose.py has no Anki dependency; import it without the add-on package,
+# whose __init__ needs aqt
+sys.path.insert(0, str(ROOT / "heisig_addon"))
+import decompose  # noqa: E402
+
+MAX_BODY = 1 << 20
+MAX_BATCH = 1000
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+            413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class LRUCache:
+    """Least-recently-used cache of rendered responses."""
+
+    def __init__(self, size):
+        self.size = size
+        self.hits = self.misses = 0
+        self._items = OrderedDict()
+
+    def get(self, key):
+        if key in self._items:
+            self._items.move_to_end(key)
+            self.hits += 1
+            return self._items[key]
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        if self.size <= 0:
+            return
+        self._items[key] = value
+        self._items.move_to_end(key)
+        if len(self._items) > self.size:
+            self._items.popitem(last=False)
+
+    def __len__(self):
+        return len(self._items)
+
+
+def _json(obj):
+    return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+
+def explain(char):
+    """{"char", "html"} for char, or None if it isn't in the data."""
+    info = decompose.lookup(char)
+    if info is None:
+        return None
+    return {"char": char, "html": decompose.format_explanation(char, info)}
+
+
+ENDPOINTS = {"/lookup": decompose.lookup, "/explain": explain}
+
+
+def _batch_chars(body):
+    try:
+        chars = json.loads(body)["chars"]
+    except (ValueError, KeyError, TypeError):
+        raise HTTPError(400, 'expected a JSON body {"chars": [...]}')
+    if isinstance(chars, str):
+        chars = list(chars)
+    if not isinstance(chars, list) or not all(isinstance(c, str) for c in chars):
+        raise HTTPError(400, '"chars" must be a string or a list of strings')
+    if len(chars) > MAX_BATCH:
+        raise HTTPError(400, f"at most {MAX_BATCH} characters per request")
+    return chars
+
+
+def render(method, target, body):
+    """(status, JSON body bytes) for one request."""
+    url = urlsplit(target)
+    handler = ENDPOINTS.get(url.path)
+    if handler is None:
+        raise HTTPError(404, f"no endpoint {url.path}")
+    if method == "GET":
+        char = parse_qs(url.query).get("char", [""])[0].strip()
+        if not char:
+            raise HTTPError(400, "missing ?char=")
+        result = handler(char)
+        if result is None:
+            raise HTTPError(404, f"{char} not found")
+        return 200, _json(result)
+    if method == "POST":
+        # dict.fromkeys: one result per distinct character, in request order
+        chars = dict.fromkeys(c.strip() for c in _batch_chars(body))
+        return 200, _json({"results": {c: handler(c) for c in chars if c}})
+    raise HTTPError(405, f"{method} not supported")
+
+
+def _response(status, body, keep_alive):
+    head = (f"HTTP/1.1 {status} {_REASONS.get(status, 'Error')}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    return head.encode("ascii") + body
+
+
+class LookupServer:
+    def __init__(self, cache_size=4096):
+        self.cache = LRUCache(cache_size)
+        self.requests = 0
+
+    def respond(self, method, target, body):
+        """Response (status, body) for a request, from the cache if possible."""
+        self.requests += 1
+        if target == "/stats":
+            return 200, _json({"requests": self.requests, "cache_entries": len(self.cache),
+                               "cache_hits": self.cache.hits, "cache_misses": self.cache.misses})
+        # Key on a digest, not the body: POST bodies can be up to MAX_BODY
+        key = (method, target, hashlib.sha256(body).digest() if body else b"")
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        try:
+            response = render(method, target, body)
+        except HTTPError as e:
+            response = e.status, _json({"error": str(e)})
+        except Exception as e:
+            # Not cached: may not happen again
+            return 500, _json({"error": f"{type(e).__name__}: {e}"})
+        # Errors are cached too: the data doesn't change while serving
+        self.cache.put(key, response)
+        return response
+
+    async def _error(self, writer, status, message):
+        writer.write(_response(status, _json({"error": message}), False))
+        await writer.drain()
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request_line = await reader.readline()
+                    if not request_line:
+                        break
+                    headers = {}
+                    while True:
+                        line = await reader.readline()
+                        if line in (b"\r\n", b"\n", b""):
+                            break
+                        name, _, value = line.decode("latin-1").partition(":")
+                        headers[name.strip().lower()] = value.strip()
+                except (ValueError, asyncio.LimitOverrunError):
+                    # readline raises ValueError for lines over the stream limit
+                    await self._error(writer, 400, "request line or header too long")
+                    break
+                try:
+                    # Targets should be percent-encoded, but accept raw UTF-8 too
+                    method, target, version = request_line.decode("utf-8", "replace").split()
+                except ValueError:
+                    await self._error(writer, 400, "malformed request line")
+                    break
+
+                length = headers.get("content-length") or "0"
+                if not (length.isascii() and length.isdigit()):
+                    await self._error(writer, 400, "invalid Content-Length")
+                    break
+                length = int(length)
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                if length > MAX_BODY:
+                    await self._error(writer, 413, "body too large")
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                status, payload = self.respond(method, target, body)
+                writer.write(_response(status, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host, port):
+        return await asyncio.start_server(self.handle, host, port)
+
+
+# ── Load test ─────────────────────────────────────────────────────────
+
+
+async def _client(host, port, paths, latencies, errors):
+    """Send each path over one keep-alive connection, recording latencies."""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for path in paths:
+            start = time.perf_counter()
+            writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode("utf-8"))
+            await writer.drain()
+            status = int((await reader.readline()).split()[1])
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b""):
+                    break
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":")[1])
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors.append(status)
+    finally:
+        writer.close()
+
+
+def percentile(sorted_values, p):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))]
+
+
+def load_test_paths(n, seed=0):
+    """n request paths: lookups and explanations of characters drawn with
+    Zipf-like weights, so some repeat (as in real text) and some don't."""
+    rng = random.Random(seed)
+    chars = decompose.characters()
+    rng.shuffle(chars)
+    weights = [1 / (rank + 1) for rank in range(len(chars))]
+    picks = rng.choices(chars, weights, k=n)
+    return [f"{rng.choice(('/lookup', '/explain'))}?char={quote(c)}" for c in picks]
+
+
+async def load_test(requests, concurrency, target=None, cache_size=4096):
+    """Run the load test; returns the report dict."""
+    server = None
+    if target:
+        host, port = target.rsplit(":", 1)
+        port = int(port)
+    else:
+        # In-process server on a free port; client and server share this process
+        lookup = LookupServer(cache_size)
+        server = await lookup.start("127.0.0.1", 0)
+        host, port = server.sockets[0].getsockname()[:2]
+
+    paths = load_test_paths(requests)
+    chunks = [paths[i::concurrency] for i in range(concurrency)]
+    latencies, errors = [], []
+    start = time.perf_counter()
+    await asyncio.gather(*(_client(host, port, chunk, latencies, errors) for chunk in chunks if chunk))
+    elapsed = time.perf_counter() - start
+    if server is not None:
+        server.close()
+        await server.wait_closed()
+
+    latencies.sort()
+    report = {
+        "requests": len(latencies),
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 3),
+        "req_per_s": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3),
+        "non_200": len(errors),
+    }
+    if server is not None:
+        report["cache_hit_rate"] = round(lookup.cache.hits / max(1, lookup.cache.hits + lookup.cache.misses), 3)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--cache-size", type=int, default=4096,
+                        help="rendered responses to keep (0 disables the cache)")
+    parser.add_argument("--load-test", action="store_true",
+                        help="benchmark an in-process server (or --target) and exit")
+    parser.add_argument("--target", help="host:port of a running server to load-test")
+    parser.add_argument("-n", "--requests", type=int, default=20000, help="load-test requests")
+    parser.add_argument("-c", "--concurrency", type=int, default=16, help="load-test connections")
+    args = parser.parse_args()
+
+    if args.load_test:
+        report = asyncio.run(load_test(args.requests, args.concurrency, args.target, args.cache_size))
+        where = args.target or f"in-process server, cache size {args.cache_size}"
+        print(f"Load test ({where}): {report['requests']} requests over "
+              f"{report['concurrency']} connections in {report['seconds']:.2f}s")
+        print(f"  {report['req_per_s']:.0f} req/s, p50 {report['p50_ms']:.2f} ms, "
+              f"p99 {report['p99_ms']:.2f} ms, max {report['max_ms']:.2f} ms")
+        if "cache_hit_rate" in report:
+            print(f"  cache hit rate {report['cache_hit_rate']:.0%}")
+        if report["non_200"]:
+            print(f"  {report['non_200']} non-200 responses")
+        return
+
+    async def serve():
+        server = await LookupServer(args.cache_size).start(args.host, args.port)
+        print(f"Serving {decompose.entry_count()} characters on http://{args.host}:{args.port}/")
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,8 @@ import json
 import re
 from pathlib import Path
 
+from artifacts import AtomicOutput, status
+
 ROOT = Path(__file__).resolve().parent.parent
 
 # IDS operator labels
@@ -60,18 +62,62 @@ def parse_decomposition(components_detail):
     return " + ".join(keywords)
 
 
-def load_existing_csv(path):
-    """Load CSV as list of dicts, keyed by character."""
-    chars = {}
-    rows = []
-    with open(path, "r", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        fieldnames = reader.fieldnames
+GENERATED_TAGS = ("SC::", "TC::", "ML::", "TW::")
+
+
+def to_row(e, deck):
+    """Convert a generated entry to CSV row format with decomposition and spatial filled in."""
+    ids_raw = e.get("ids", "")
+    components = e.get("components_detail", "")
+    # Clean IDS for storage
+    ids_clean = re.sub(r'^\^', '', ids_raw)
+    ids_clean = re.sub(r'\$\([A-Z]+\)$', '', ids_clean)
+    return {
+        "character": e["char"],
+        "keyword": e["keyword"],
+        "RTH_number": "",
+        "RSH_number": "",
+        "RTK_number": "",
+        "reading": e.get("reading", ""),
+        "decomposition": parse_decomposition(components),
+        "spatial": parse_spatial(ids_raw),
+        "ids": ids_clean,
+        "components_detail": components,
+        "deck": deck,
+        "tags": e.get("tags", ""),
+    }
+
+
+def merge_deck(path, *additions):
+    """Rewrite a deck CSV as its Heisig rows followed by generated rows.
+
+    The deck is streamed straight to its replacement: old generated rows
+    (SC::/TC:: tags) are dropped and the rest are copied in order while
+    their characters are collected. Then each addition (a list of rows) is
+    appended, skipping characters already in the deck. Returns
+    (total rows, rows added, changed).
+    """
+    seen = set()
+    total = added = 0
+    out = AtomicOutput(path, "w", encoding="utf-8", newline="")
+    with open(path, "r", encoding="utf-8") as src, out as dst:
+        reader = csv.DictReader(src)
+        writer = csv.DictWriter(dst, fieldnames=reader.fieldnames)
+        writer.writeheader()
         for row in reader:
-            char = row["character"]
-            chars[char] = len(rows)
-            rows.append(dict(row))
-    return rows, chars, fieldnames
+            if row.get("tags", "").startswith(GENERATED_TAGS):
+                continue
+            writer.writerow(row)
+            seen.add(row["character"])
+            total += 1
+        for rows in additions:
+            for row in rows:
+                if row["character"] in seen:
+                    continue
+                writer.writerow(row)
+                seen.add(row["character"])
+                added += 1
+    return total + added, added, out.changed
 
 
 def main():
@@ -83,104 +129,35 @@ def main():
 
     print(f"Loaded {len(simplified)} simplified, {len(traditional)} traditional entries")
 
-    # Convert to CSV row format with decomposition and spatial filled in
-    def to_row(e, deck):
-        ids_raw = e.get("ids", "")
-        components = e.get("components_detail", "")
-        # Clean IDS for storage
-        ids_clean = re.sub(r'^\^', '', ids_raw)
-        ids_clean = re.sub(r'\$\([A-Z]+\)$', '', ids_clean)
-        return {
-            "character": e["char"],
-            "keyword": e["keyword"],
-            "RTH_number": "",
-            "RSH_number": "",
-            "RTK_number": "",
-            "reading": e.get("reading", ""),
-            "decomposition": parse_decomposition(components),
-            "spatial": parse_spatial(ids_raw),
-            "ids": ids_clean,
-            "components_detail": components,
-            "deck": deck,
-            "tags": e.get("tags", ""),
-        }
+    # Each generated entry is converted once and shared by every output
+    sc_rows = [to_row(e, "SC") for e in simplified]
+    tc_rows = [to_row(e, "TC") for e in traditional]
+    del simplified, traditional
+    # SC::L1 and SC::L2 are the practical simplified chars added to decks
+    sc_practical = [r for r in sc_rows if r["tags"] in ("SC::L1", "SC::L2")]
 
     # Save simplified to separate file (not added to main decks)
     ml_fieldnames = ["character", "keyword", "reading", "decomposition", "spatial",
                      "ids", "components_detail", "tags"]
-    ml_rows = [to_row(e, "SC") for e in simplified]
-    with open(ROOT / "data" / "simplified_additions.csv", "w", encoding="utf-8", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=ml_fieldnames)
-        writer.writeheader()
-        for row in ml_rows:
-            writer.writerow({k: row[k] for k in ml_fieldnames})
-    print(f"data/simplified_additions.csv: {len(ml_rows)} simplified chars saved separately")
-
-    # Process RSH_deck.csv (simplified - Heisig + SC::L1 + SC::L2)
-    rsh_rows, rsh_chars, fieldnames = load_existing_csv(ROOT / "RSH_deck.csv")
-
-    # Remove old generated entries (those with SC:: or TC:: tags)
-    rsh_rows = [r for r in rsh_rows if not r.get("tags", "").startswith(("SC::", "TC::", "ML::", "TW::"))]
-    rsh_chars = {r["character"]: i for i, r in enumerate(rsh_rows)}
-
-    # Add SC::L1 and SC::L2 (practical simplified chars)
-    sc_added = 0
-    for e in simplified:
-        tags = e.get("tags", "")
-        if tags in ("SC::L1", "SC::L2") and e["char"] not in rsh_chars:
-            rsh_rows.append(to_row(e, "SC"))
-            rsh_chars[e["char"]] = len(rsh_rows) - 1
-            sc_added += 1
-
-    with open(ROOT / "RSH_deck.csv", "w", encoding="utf-8", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
+    out = AtomicOutput(ROOT / "data" / "simplified_additions.csv", "w", encoding="utf-8", newline="")
+    with out as f:
+        writer = csv.DictWriter(f, fieldnames=ml_fieldnames, extrasaction="ignore")
         writer.writeheader()
-        writer.writerows(rsh_rows)
-    print(f"RSH_deck.csv: {len(rsh_rows)} total (Heisig + {sc_added} SC::L1/L2)")
+        writer.writerows(sc_rows)
+    print(f"data/simplified_additions.csv: {len(sc_rows)} simplified chars saved separately "
+          f"({status(out.changed)})")
 
-    # Process RTH_deck.csv (traditional - add traditional A/B chars)
-    rth_rows, rth_chars, fieldnames = load_existing_csv(ROOT / "RTH_deck.csv")
+    # RSH_deck.csv (simplified - Heisig + SC::L1 + SC::L2)
+    total, added, changed = merge_deck(ROOT / "RSH_deck.csv", sc_practical)
+    print(f"RSH_deck.csv: {total} total (Heisig + {added} SC::L1/L2) ({status(changed)})")
 
-    # Remove old generated entries
-    rth_rows = [r for r in rth_rows if not r.get("tags", "").startswith(("SC::", "TC::", "ML::", "TW::"))]
-    rth_chars = {r["character"]: i for i, r in enumerate(rth_rows)}
+    # RTH_deck.csv (traditional - add traditional A/B chars)
+    total, added, changed = merge_deck(ROOT / "RTH_deck.csv", tc_rows)
+    print(f"RTH_deck.csv: {total} total ({added} traditional A/B added) ({status(changed)})")
 
-    tw_added = 0
-    for e in traditional:
-        if e["char"] not in rth_chars:
-            rth_rows.append(to_row(e, "TC"))
-            tw_added += 1
-
-    with open(ROOT / "RTH_deck.csv", "w", encoding="utf-8", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(rth_rows)
-    print(f"RTH_deck.csv: {len(rth_rows)} total ({tw_added} traditional A/B added)")
-
-    # Process Ultimate_deck.csv (Heisig + SC::L1/L2 + TC::A/B)
-    ult_rows, ult_chars, fieldnames = load_existing_csv(ROOT / "Ultimate_deck.csv")
-
-    # Remove old generated entries
-    ult_rows = [r for r in ult_rows if not r.get("tags", "").startswith(("SC::", "TC::", "ML::", "TW::"))]
-    ult_chars = {r["character"]: i for i, r in enumerate(ult_rows)}
-
-    # Add SC::L1 and SC::L2
-    for e in simplified:
-        tags = e.get("tags", "")
-        if tags in ("SC::L1", "SC::L2") and e["char"] not in ult_chars:
-            ult_rows.append(to_row(e, "SC"))
-            ult_chars[e["char"]] = len(ult_rows) - 1
-
-    # Add traditional A/B
-    for e in traditional:
-        if e["char"] not in ult_chars:
-            ult_rows.append(to_row(e, "TC"))
-
-    with open(ROOT / "Ultimate_deck.csv", "w", encoding="utf-8", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(ult_rows)
-    print(f"Ultimate_deck.csv: {len(ult_rows)} total (Heisig + SC::L1/L2 + TC::A/B)")
+    # Ultimate_deck.csv (Heisig + SC::L1/L2 + TC::A/B)
+    total, added, changed = merge_deck(ROOT / "Ultimate_deck.csv", sc_practical, tc_rows)
+    print(f"Ultimate_deck.csv: {total} total (Heisig + SC::L1/L2 + TC::A/B) ({status(changed)})")
 
 
 if __name__ == "__main__":
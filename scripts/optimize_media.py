@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""Shrink primitive images before they are packaged into .apkg files.
+
+crop_primitives.py renders 200x200 images, but CARD_CSS shows them at
+100px (character) and 24px (components). Each image is downsized to
+MAX_SIZE, quantized to a COLORS-entry palette and saved without metadata.
+Results are cached under data/cache/media/<hash>/<name>, keyed by the
+source bytes and the settings, so unchanged images are not reprocessed.
+File names are kept, since notes reference images by name.
+
+Usage:
+  python scripts/optimize_media.py     # optimize and report savings
+"""
+
+import hashlib
+import io
+import sys
+from pathlib import Path
+
+from PIL import Image
+
+from artifacts import write_bytes_if_changed
+
+ROOT = Path(__file__).resolve().parent.parent
+CACHE_DIR = ROOT / "data" / "cache" / "media"
+
+MAX_SIZE = 128  # px; >= the largest display size in CARD_CSS (100px)
+COLORS = 32
+
+# Bump when the optimization itself changes
+OPTIMIZER_VERSION = 1
+
+
+def cache_key(data, max_size=MAX_SIZE):
+    settings = f"v{OPTIMIZER_VERSION}:{max_size}:{COLORS}".encode()
+    return hashlib.sha256(settings + b"\0" + data).hexdigest()[:16]
+
+
+def optimize_image(src, dst, max_size=MAX_SIZE):
+    """Write a downsized, quantized, metadata-free copy of src to dst.
+
+    max_size=None keeps the dimensions (for the sprite atlas, whose cells
+    are already MAX_SIZE). Falls back to the original bytes if optimizing
+    doesn't make it smaller.
+    """
+    data = Path(src).read_bytes()
+    with Image.open(io.BytesIO(data)) as im:
+        im = im.convert("RGBA")
+        if max_size:
+            im.thumbnail((max_size, max_size), Image.LANCZOS)
+        im = im.quantize(COLORS, method=Image.Quantize.FASTOCTREE)
+        out = io.BytesIO()
+        im.save(out, "PNG", optimize=True)
+    optimized = out.getvalue()
+    write_bytes_if_changed(dst, optimized if len(optimized) < len(data) else data)
+
+
+def optimize_media(paths, cache_dir=CACHE_DIR, max_size=MAX_SIZE):
+    """Return optimized copies of the given image paths, in the same order."""
+    result = []
+    for src in map(Path, paths):
+        dst = Path(cache_dir) / cache_key(src.read_bytes(), max_size) / src.name
+        if not dst.exists():
+            optimize_image(src, dst, max_size)
+        result.append(str(dst))
+    return result
+
+
+def total_size(paths):
+    return sum(Path(p).stat().st_size for p in paths)
+
+
+def main():
+    src_dir = ROOT / "data" / "primitive_images"
+    # Skips the sprite atlas (_heisig_primitives.png)
+    paths = sorted(p for p in src_dir.glob("*.png") if not p.name.startswith("_"))
+    if not paths:
+        print(f"No images in {src_dir}")
+        sys.exit(1)
+    optimized = optimize_media(paths)
+    before, after = total_size(paths), total_size(optimized)
+    print(f"{len(paths)} images: {before / 1024:.1f} KB -> {after / 1024:.1f} KB "
+          f"({1 - after / before:.0%} smaller, max {MAX_SIZE}px, {COLORS} colors)")
+    print(f"Cache: {CACHE_DIR}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,54 +1,22 @@
 """Parse rsh.xml to extract characters, primitives, and decompositions."""
-import xml.etree.ElementTree as ET
 import json
 import csv
 
-tree = ET.parse("data/heisig-repo/rsh.xml")
-root = tree.getroot()
+from artifacts import write_text_if_changed
+from rsh_xml import RSH_XML, load_rsh
 
-characters = []  # frames with type="character"
-primitives = []  # frames with type="primitive"
-
-for frame in root.iter("frame"):
-    frame_type = frame.get("{http://www.w3.org/2001/XMLSchema-instance}type")
-    char = frame.get("character")
-    keyword = frame.get("keyword")
-    number = frame.get("number")  # only characters have numbers
-
-    # Get primitive aliases (pself tags inside <primitive> block)
-    prim_block = frame.find("primitive")
-    aliases = []
-    if prim_block is not None:
-        aliases = [ps.text for ps in prim_block.iter("pself") if ps.text]
-
-    # Get components (cite tags = what this frame is made of)
-    components = []
-    for p in frame.findall("p"):
-        for cite in p.iter("cite"):
-            if cite.text:
-                components.append(cite.text)
-
-    entry = {
-        "character": char,
-        "keyword": keyword,
-        "type": frame_type,
-        "number": int(number) if number else None,
-        "primitive_aliases": aliases,
-        "components": components,
-    }
-
-    if frame_type == "character":
-        characters.append(entry)
-    elif frame_type == "primitive":
-        primitives.append(entry)
+# One streaming pass over rsh.xml, cached in data/cache/ (see rsh_xml.py)
+rsh = load_rsh(RSH_XML)
+characters = rsh["characters"]  # frames with type="character"
+primitives = rsh["primitives"]  # frames with type="primitive"
 
 # Save to JSON
 output = {
     "characters": characters,
     "primitives": primitives,
 }
-with open("data/rsh_parsed.json", "w", encoding="utf-8") as f:
-    json.dump(output, f, ensure_ascii=False, indent=2)
+write_text_if_changed("data/rsh_parsed.json",
+                      json.dumps(output, ensure_ascii=False, indent=2))
 
 # Print summary
 print(f"Characters: {len(characters)}")
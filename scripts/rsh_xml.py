@@ -0,0 +1,120 @@
+"""Streaming reader for rsh.xml, shared by parse_rsh.py and crop_primitives.py.
+
+rsh.xml is read in one pass with iterparse. Each <frame> is turned into a
+plain dict when it closes and is then removed from the tree, so memory
+stays flat however large the XML edition is:
+
+  {
+    "characters": [entry, ...],   # frames with xsi:type="character"
+    "primitives": [entry, ...],   # frames with xsi:type="primitive"
+    "jiong":      {keyword: 囧 string},  # frames with no Unicode form
+  }
+
+where each entry has character, keyword, type, number,
+primitive_aliases and components.
+
+The result is cached under data/cache/ and reused until the SHA-256 of
+rsh.xml changes.
+"""
+
+import json
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+from artifacts import file_sha256, write_text_if_changed
+
+ROOT = Path(__file__).resolve().parent.parent
+RSH_XML = ROOT / "data" / "heisig-repo" / "rsh.xml"
+CACHE_DIR = ROOT / "data" / "cache"
+
+# Bump when the intermediate layout changes
+INTERMEDIATE_VERSION = 1
+
+XSI_TYPE = "{http://www.w3.org/2001/XMLSchema-instance}type"
+
+
+def frame_entry(frame):
+    """Plain dict for one <frame> element."""
+    number = frame.get("number")  # only characters have numbers
+
+    # Primitive aliases (pself tags inside the <primitive> block)
+    prim_block = frame.find("primitive")
+    aliases = []
+    if prim_block is not None:
+        aliases = [ps.text for ps in prim_block.iter("pself") if ps.text]
+
+    # Components (cite tags = what this frame is made of)
+    components = []
+    for p in frame.findall("p"):
+        for cite in p.iter("cite"):
+            if cite.text:
+                components.append(cite.text)
+
+    return {
+        "character": frame.get("character"),
+        "keyword": frame.get("keyword"),
+        "type": frame.get(XSI_TYPE),
+        "number": int(number) if number else None,
+        "primitive_aliases": aliases,
+        "components": components,
+    }
+
+
+def iter_frames(path=RSH_XML):
+    """Yield (entry, on_page) for every frame in document order.
+
+    on_page is True for frames directly on a <page> inside a <book>, the
+    frames crop_primitives has always looked at for 囧 primitives.
+    """
+    stack = []
+    for event, elem in ET.iterparse(path, events=("start", "end")):
+        if event == "start":
+            stack.append(elem)
+            continue
+        stack.pop()
+        if elem.tag != "frame":
+            continue
+        on_page = (bool(stack) and stack[-1].tag == "page"
+                   and any(e.tag == "book" for e in stack))
+        yield frame_entry(elem), on_page
+        # Drop the finished frame so the tree never holds more than one
+        elem.clear()
+        if stack:
+            stack[-1].remove(elem)
+
+
+def read_rsh(path=RSH_XML):
+    """Parse rsh.xml into the intermediate described above."""
+    characters, primitives, jiong = [], [], {}
+    for entry, on_page in iter_frames(path):
+        if entry["type"] == "character":
+            characters.append(entry)
+        elif entry["type"] == "primitive":
+            primitives.append(entry)
+        char = entry["character"] or ""
+        if on_page and "囧" in char:
+            jiong[entry["keyword"] or ""] = char
+    return {"characters": characters, "primitives": primitives, "jiong": jiong}
+
+
+def load_rsh(path=RSH_XML, cache_dir=CACHE_DIR):
+    """Return the intermediate for path, using the on-disk cache when fresh."""
+    path = Path(path)
+    digest = file_sha256(path)
+    cache_path = Path(cache_dir) / f"{path.stem}.frames.json"
+
+    if cache_path.exists():
+        try:
+            with open(cache_path, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+            if (cached.get("version") == INTERMEDIATE_VERSION
+                    and cached.get("source_sha256") == digest):
+                return cached["rsh"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+    rsh = read_rsh(path)
+    # Atomic: parse_rsh and crop_primitives may run at the same time
+    write_text_if_changed(cache_path, json.dumps(
+        {"version": INTERMEDIATE_VERSION, "source_sha256": digest, "rsh": rsh}, ensure_ascii=False))
+    return rsh
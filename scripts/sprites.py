@@ -0,0 +1,96 @@
+"""Sprite atlas for primitive images.
+
+crop_primitives.py packs every primitive image into one PNG (ATLAS_FILE)
+on a grid of CELL x CELL cells and writes a coordinate map, atlas.json:
+
+  {"file": ..., "cell": 128, "columns": 8, "rows": 8,
+   "sprites": {keyword: {"column": 0, "row": 0}}}
+
+Cards and the web demo show a primitive as an element whose background is
+the atlas. background-size scales the whole grid to the element, so
+percentage offsets select a cell at any display size (100px on the front
+of a card, 24px in the component list). One media file replaces one file
+per primitive.
+
+The sprite carries its keyword as visually hidden text. The background
+image is invisible to Anki, which checksums a note's first field with
+HTML stripped: without text, every primitive's Character field would be
+empty and collide as a duplicate.
+"""
+
+import html
+import json
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+PRIM_IMAGES_DIR = ROOT / "data" / "primitive_images"
+RSH_JSON = ROOT / "data" / "rsh_parsed.json"
+
+# Anki keeps media whose name starts with "_" even when no field refers to it
+ATLAS_FILE = "_heisig_primitives.png"
+ATLAS_PATH = PRIM_IMAGES_DIR / ATLAS_FILE
+ATLAS_MAP_PATH = PRIM_IMAGES_DIR / "atlas.json"
+CELL = 128  # px; matches optimize_media.MAX_SIZE
+
+
+def load_atlas(path=ATLAS_MAP_PATH):
+    """The atlas coordinate map, or None if there is no atlas."""
+    path = Path(path)
+    if not path.exists() or not (path.parent / ATLAS_FILE).exists():
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def jiong_primitives(rsh_path=RSH_JSON):
+    """Map each 囧 string in rsh_parsed.json to its primitive keyword."""
+    with open(rsh_path, "r", encoding="utf-8") as f:
+        rsh = json.load(f)
+    return {p["character"]: p["keyword"] for p in rsh["primitives"] if "囧" in p["character"]}
+
+
+def _percent(i, n):
+    return f"{round(100 * i / (n - 1), 4):g}%" if n > 1 else "0%"
+
+
+def background_size(atlas):
+    return f"{atlas['columns'] * 100}% {atlas['rows'] * 100}%"
+
+
+def background_position(atlas, keyword):
+    """CSS background-position of keyword's cell, or None if it has none."""
+    cell = atlas["sprites"].get(keyword)
+    if cell is None:
+        return None
+    return f"{_percent(cell['column'], atlas['columns'])} {_percent(cell['row'], atlas['rows'])}"
+
+
+def sprite_css(atlas, selector=".prim", url=None):
+    """CSS rules drawing the atlas behind selector; size is set by the caller."""
+    return (f'{selector} {{\n'
+            f'  display: inline-block;\n'
+            f'  position: relative;\n'
+            f'  background: url("{url or atlas["file"]}") no-repeat;\n'
+            f'  background-size: {background_size(atlas)};\n'
+            f'}}\n'
+            f'{selector} > span {{\n'
+            f'  position: absolute;\n'
+            f'  width: 1px;\n'
+            f'  height: 1px;\n'
+            f'  overflow: hidden;\n'
+            f'  clip: rect(0 0 0 0);\n'
+            f'  white-space: nowrap;\n'
+            f'}}\n')
+
+
+def sprite_html(atlas, keyword, css_class="prim"):
+    """A <span> showing keyword's sprite, or None if it has none.
+
+    The keyword is inside as hidden text (see the module docstring).
+    """
+    position = background_position(atlas, keyword)
+    if position is None:
+        return None
+    label = html.escape(keyword)
+    return (f'<span class="{css_class}" style="background-position:{position}" '
+            f'title="{label}"><span>{label}</span></span>')
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""Indexed store for selected Unihan fields.
+
+The Unihan text files are converted once into one binary table per field
+under data/cache/unihan/:
+
+  header   magic, entry count
+  cps      sorted uint32 codepoints (native byte order; this is a local cache)
+  offsets  uint32 offsets into the value blob (count + 1 entries)
+  values   UTF-8 field values, concatenated
+
+Tables are memory-mapped and searched by bisection, so a script can load
+one field (e.g. kTotalStrokes) without reading the others or the source
+text. The index is rebuilt when the SHA-256 of any source file changes.
+
+Usage:
+  python scripts/unihan_index.py          # (re)build the index
+  python scripts/unihan_index.py 啃 齕    # show the indexed fields
+"""
+
+import json
+import mmap
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from pathlib import Path
+
+from artifacts import file_sha256, write_bytes_if_changed, write_text_if_changed
+
+ROOT = Path(__file__).resolve().parent.parent
+DATA_DIR = ROOT / "data"
+INDEX_DIR = ROOT / "data" / "cache" / "unihan"
+
+# Bump when the table layout changes
+INDEX_VERSION = 1
+
+FIELDS = ("kDefinition", "kMandarin", "kJapanese", "kTotalStrokes")
+
+# kTotalStrokes moved from DictionaryLikeData to IRGSources in Unicode 13;
+# whichever files are present are scanned
+SOURCES = ("Unihan_Readings.txt", "Unihan_IRGSources.txt", "Unihan_DictionaryLikeData.txt")
+
+_MAGIC = b"UNHX"
+_HEADER = struct.Struct("=4sI")
+
+
+def read_unihan(paths, fields=FIELDS):
+    """Yield (codepoint, field, value) for the wanted fields in the given files."""
+    wanted = set(fields)
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.startswith("U+"):
+                    continue
+                parts = line.rstrip().split("\t", 2)
+                if len(parts) == 3 and parts[1] in wanted:
+                    yield int(parts[0][2:], 16), parts[1], parts[2]
+
+
+def _pack(entries):
+    """Serialize {codepoint: value} as one table."""
+    cps = array("I", sorted(entries))
+    offsets = array("I", [0])
+    blob = bytearray()
+    for cp in cps:
+        blob += entries[cp].encode("utf-8")
+        offsets.append(len(blob))
+    return _HEADER.pack(_MAGIC, len(cps)) + cps.tobytes() + offsets.tobytes() + bytes(blob)
+
+
+def _source_paths(data_dir):
+    return [Path(data_dir) / name for name in SOURCES if (Path(data_dir) / name).exists()]
+
+
+def _source_hashes(paths):
+    return {p.name: file_sha256(p) for p in paths}
+
+
+def build_index(data_dir=DATA_DIR, index_dir=INDEX_DIR, fields=FIELDS):
+    """Convert the Unihan source files into per-field tables.
+
+    Returns the number of entries written per field.
+    """
+    paths = _source_paths(data_dir)
+    by_field = {field: {} for field in fields}
+    for cp, field, value in read_unihan(paths, fields):
+        by_field[field][cp] = value
+
+    index_dir = Path(index_dir)
+    for field, entries in by_field.items():
+        write_bytes_if_changed(index_dir / f"{field}.bin", _pack(entries))
+    meta = {
+        "version": INDEX_VERSION,
+        "sources": _source_hashes(paths),
+        "fields": {field: len(entries) for field, entries in by_field.items()},
+    }
+    write_text_if_changed(index_dir / "meta.json", json.dumps(meta, indent=2))
+    return meta["fields"]
+
+
+def _is_fresh(data_dir, index_dir, fields):
+    meta_path = Path(index_dir) / "meta.json"
+    if not meta_path.exists():
+        return False
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return (meta.get("version") == INDEX_VERSION
+            and all(field in meta.get("fields", {}) for field in fields)
+            and meta.get("sources") == _source_hashes(_source_paths(data_dir)))
+
+
+class UnihanField:
+    """Read-only char -> value mapping backed by a memory-mapped table."""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._count = _HEADER.unpack_from(self._mm)
+        if magic != _MAGIC:
+            raise ValueError(f"{path} is not a Unihan index table")
+        view = memoryview(self._mm)
+        start = _HEADER.size
+        self._cps = view[start:start + 4 * self._count].cast("I")
+        start += 4 * self._count
+        self._offsets = view[start:start + 4 * (self._count + 1)].cast("I")
+        self._values = start + 4 * (self._count + 1)
+
+    def _value(self, i):
+        lo, hi = self._offsets[i], self._offsets[i + 1]
+        return self._mm[self._values + lo:self._values + hi].decode("utf-8")
+
+    def _find(self, char):
+        if len(char) != 1:
+            return -1
+        cp = ord(char)
+        i = bisect_left(self._cps, cp)
+        return i if i < self._count and self._cps[i] == cp else -1
+
+    def get(self, char, default=None):
+        i = self._find(char)
+        return default if i < 0 else self._value(i)
+
+    def __getitem__(self, char):
+        i = self._find(char)
+        if i < 0:
+            raise KeyError(char)
+        return self._value(i)
+
+    def __contains__(self, char):
+        return self._find(char) >= 0
+
+    def __len__(self):
+        return self._count
+
+    def items(self):
+        for i in range(self._count):
+            yield chr(self._cps[i]), self._value(i)
+
+
+_loaded = {}
+
+
+def load_field(field, data_dir=DATA_DIR, index_dir=INDEX_DIR):
+    """Return the UnihanField for field, building the index first if stale.
+
+    Returns an empty dict when no Unihan source files are present.
+    """
+    key = (field, str(index_dir))
+    if key in _loaded:
+        return _loaded[key]
+    if field not in FIELDS:
+        raise KeyError(f"{field} is not indexed (indexed fields: {', '.join(FIELDS)})")
+    if not _source_paths(data_dir):
+        return {}
+    if not _is_fresh(data_dir, index_dir, FIELDS):
+        build_index(data_dir, index_dir)
+    _loaded[key] = UnihanField(Path(index_dir) / f"{field}.bin")
+    return _loaded[key]
+
+
+def total_strokes(char):
+    """First kTotalStrokes value for char (the Chinese count), or None."""
+    value = load_field("kTotalStrokes").get(char)
+    return int(value.split()[0]) if value else None
+
+
+if __name__ == "__main__":
+    if not _source_paths(DATA_DIR):
+        print(f"No Unihan files found in {DATA_DIR} (looked for {', '.join(SOURCES)})")
+        sys.exit(1)
+    if len(sys.argv) > 1:
+        for char in "".join(sys.argv[1:]):
+            print(f"{char} U+{ord(char):04X}")
+            for field in FIELDS:
+                print(f"  {field}: {load_field(field).get(char, '-')}")
+    else:
+        counts = build_index()
+        for field, n in counts.items():
+            print(f"  {field}: {n} entries")
+        print(f"Saved: {INDEX_DIR}")
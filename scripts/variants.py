@@ -0,0 +1,177 @@
+"""Variant equivalence classes over radical, traditional, simplified and kanji forms.
+
+All variant edges (Unicode radical decompositions, the manual radical map,
+and the Excel trad->simp and kanji->simp pairs) go into one union-find
+structure, so chains such as traditional -> simplified -> radical form
+resolve to the same class. Each class has at most one member with a
+Heisig name, its canonical: an edge between two classes that are both
+already named is not merged, so one named character's variants never
+take another's keyword. A character with a direct edge to a named
+character resolves to it (as each edge did before the classes existed);
+others resolve through their class. Lookups are O(α(n)).
+
+build_mapping.py writes the resolved table to data/variant_map.json:
+
+  variant char -> {"canonical": named char, "kind": "radical" | "variant"}
+
+build_decks.py and build_addon_data.py (for the add-on) read that table.
+"""
+
+import json
+import unicodedata
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+VARIANT_MAP_PATH = ROOT / "data" / "variant_map.json"
+
+# Radical / component forms -> parent character
+RADICAL_MAP = {
+    # Simplified radicals that appear as components
+    '讠': '言',  # speech
+    '钅': '金',  # metal
+    '饣': '食',  # food
+    '纟': '糸',  # thread
+    '贝': '貝',  # shell
+    '车': '車',  # vehicle
+    '见': '見',  # see
+    '门': '門',  # gate
+    '鱼': '魚',  # fish
+    '马': '馬',  # horse
+    '鸟': '鳥',  # bird
+    '页': '頁',  # page
+    '风': '風',  # wind
+    '韦': '韋',  # leather
+    '长': '長',  # long
+    '齿': '齒',  # teeth
+    '龙': '龍',  # dragon
+    '龟': '龜',  # turtle
+    # Side and top forms
+    '亻': '人',  # person (side)
+    '氵': '水',  # water (side)
+    '扌': '手',  # hand (side)
+    '忄': '心',  # heart (side)
+    '犭': '犬',  # dog (side)
+    '礻': '示',  # spirit/show (side)
+    '衤': '衣',  # clothing (side)
+    '⺗': '心',  # heart variant
+    '⺝': '月',  # moon/flesh variant
+    '⺼': '月',  # meat/flesh radical -> month (same in heisig)
+    '⺶': '羊',  # sheep variant
+    '灬': '火',  # fire dots (but Heisig calls this "cooking fire" separately)
+    '⺌': '小',  # small top
+    '⺊': '卜',  # divination
+    '⺀': '八',  # eight variant
+    '⺄': '乙',  # second variant
+    '⺆': '冂',  # hood variant
+    '⺈': '刀',  # knife variant
+    # Traditional component forms
+    '訁': '言', '糹': '糸', '釒': '金', '𥫗': '竹', '刂': '刀',
+    '彳': '行', '𤣩': '玉', '𧾷': '足', '罒': '网', '乚': '乙',
+    '飠': '食', '爫': '爪', '虍': '虎', '𧘇': '衣', '龶': '生',
+    '𦍌': '羊', '亍': '行', '牜': '牛', '覀': '西', '丬': '爿',
+    '䒑': '丷',
+}
+
+
+def unicode_radical_edges():
+    """(radical, parent) pairs from the CJK Radicals Supplement and Kangxi
+    Radicals blocks, via their Unicode decomposition mappings."""
+    for cp in range(0x2E80, 0x2FE0):
+        ch = chr(cp)
+        decomp = unicodedata.decomposition(ch)
+        if decomp:
+            # Format like "2F00" or "<compat> 2F00"; the last value is the parent
+            try:
+                yield ch, chr(int(decomp.split()[-1], 16))
+            except ValueError:
+                pass
+
+
+class VariantClasses:
+    """Union-find over variant edges, tracking a named canonical per class."""
+
+    def __init__(self, named):
+        self.named = named
+        self.parent = {}
+        self.size = {}
+        self.canon = {}  # root -> named member, or None
+        self.kind = {}   # char -> kind of the first edge it was a variant in
+        self.direct = {}  # unnamed char -> first named char it's a variant of
+
+    def _add(self, x):
+        if x not in self.parent:
+            self.parent[x] = x
+            self.size[x] = 1
+            self.canon[x] = x if x in self.named else None
+
+    def find(self, x):
+        parent = self.parent
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]  # path halving
+            x = parent[x]
+        return x
+
+    def union(self, variant, parent, kind):
+        """Join variant's class to parent's, unless both classes are named."""
+        self._add(variant)
+        self._add(parent)
+        self.kind.setdefault(variant, kind)
+        if variant not in self.named and parent in self.named:
+            self.direct.setdefault(variant, parent)
+        ra, rb = self.find(variant), self.find(parent)
+        if ra == rb:
+            return
+        if self.canon[ra] and self.canon[rb]:
+            return
+        canon = self.canon[rb] or self.canon[ra]
+        if self.size[ra] > self.size[rb]:
+            ra, rb = rb, ra
+        self.parent[ra] = rb
+        self.size[rb] += self.size[ra]
+        self.canon[rb] = canon
+        del self.canon[ra]
+
+    def canonical(self, char):
+        """Named character char is a direct variant of, else its class's, or None."""
+        if char not in self.parent:
+            return None
+        return self.direct.get(char) or self.canon[self.find(char)]
+
+    def table(self):
+        """{char: {"canonical", "kind"}} for unnamed chars with a named class.
+
+        Entries follow the order chars were first seen in an edge.
+        """
+        result = {}
+        for char in self.parent:
+            if char in self.named:
+                continue
+            canon = self.canonical(char)
+            if canon:
+                result[char] = {"canonical": canon, "kind": self.kind.get(char, "variant")}
+        return result
+
+
+def build_variant_table(named, variant_pairs):
+    """Resolve all radical edges plus (variant, simplified) pairs into a table.
+
+    named: characters that have a Heisig name
+    variant_pairs: iterable of (traditional or kanji char, simplified char)
+    """
+    classes = VariantClasses(named)
+    for rad, parent in unicode_radical_edges():
+        classes.union(rad, parent, "radical")
+    for rad, parent in RADICAL_MAP.items():
+        classes.union(rad, parent, "radical")
+    for char, simp in variant_pairs:
+        classes.union(char, simp, "variant")
+    return classes.table()
+
+
+def load_variant_map(path=VARIANT_MAP_PATH):
+    """Load the resolved variant table written by build_mapping.py."""
+    path = Path(path)
+    if not path.exists():
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
@@ -0,0 +1,23 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+from variants import build_variant_table  # noqa: E402
+
+
+def canonicals(named, pairs):
+    return {char: v["canonical"] for char, v in build_variant_table(named, pairs).items()}
+
+
+def test_named_classes_are_not_merged():
+    # 弁 links the 辩 and 办 classes; their variants must keep their own keyword
+    table = canonicals({"辩", "办", "瓣"},
+                       [("弁", "辩"), ("弁", "办"), ("辯", "辩"), ("辦", "办")])
+    assert table["辯"] == "辩"
+    assert table["辦"] == "办"
+    assert table["弁"] == "辩"
+
+
+def test_chains_resolve_through_unnamed_members():
+    # Kangxi radical ⾒ -> 見 -> 见, where only 见 is named
+    assert canonicals({"见"}, [("見", "见")])["⾒"] == "见"